@@ -1,20 +1,34 @@
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_URL, Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.components import conversation as ha_conversation
-from .conversation import HearthConversationAgent
-from .const import DOMAIN
+from .conversation import HearthBackend, HearthConversationAgent, STREAMING_SUPPORTED
+from .const import DOMAIN, DEFAULT_URL
+
+# Streaming-capable HA gets a conversation entity; older versions the legacy agent
+PLATFORMS = [Platform.CONVERSATION]
 
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Hearth Assistant from a config entry."""
-    hass.data.setdefault(DOMAIN, {})
-    agent = HearthConversationAgent(hass, entry)
-    ha_conversation.async_set_agent(hass, entry, agent)
+    backend = HearthBackend(hass, entry.data.get(CONF_URL, DEFAULT_URL))
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = backend
+    if STREAMING_SUPPORTED:
+        await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    else:
+        agent = HearthConversationAgent(hass, entry, backend)
+        ha_conversation.async_set_agent(hass, entry, agent)
     return True
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    ha_conversation.async_unset_agent(hass, entry)
-    return True
+    if STREAMING_SUPPORTED:
+        unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    else:
+        ha_conversation.async_unset_agent(hass, entry)
+        unloaded = True
+    if unloaded:
+        hass.data[DOMAIN].pop(entry.entry_id, None)
+    return unloaded
@@ -1,38 +1,206 @@
+import asyncio
+import json
 import logging
+import time
+from collections import OrderedDict, deque
+
 import aiohttp
-import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_URL
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import intent
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.util import ulid as ulid_util
 from homeassistant.components import conversation
 
 from .const import DOMAIN, DEFAULT_URL
 
 _LOGGER = logging.getLogger(__name__)
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    """Set up Hearth Assistant from a config entry."""
-    hass.data.setdefault(DOMAIN, {})
-    
-    agent = HearthConversationAgent(hass, entry)
-    conversation.async_set_agent(hass, entry, agent)
-    
-    return True
+# Newer HA (chat log + conversation entities): checked for the exact APIs the entity calls
+STREAMING_SUPPORTED = (
+    hasattr(conversation, "ConversationEntity")
+    and hasattr(getattr(conversation, "ChatLog", None), "async_add_delta_content_stream")
+    and hasattr(conversation, "async_get_result_from_chat_log")
+)
+
+REQUEST_TIMEOUT = 60
+# Conversations remembered, messages kept per conversation, and idle expiry (HA's own is 5 min)
+MAX_CONVERSATIONS = 32
+MAX_HISTORY_MESSAGES = 20
+HISTORY_TTL = 300
+MAX_CACHED_USERS = 32
+
+ERROR_REPLY = "I can't reach my brain right now."
+
+class HearthBackend:
+    """
+    Talks to the Hearth bot's /chat API over HA's shared HTTP session.
+    Keeps per-conversation history (LRU + idle expiry) and a small LRU of user names.
+    """
+
+    def __init__(self, hass: HomeAssistant, url: str) -> None:
+        self.hass = hass
+        self.url = url.rstrip("/")
+        self.session = async_get_clientsession(hass)
+        self._users = OrderedDict()
+        self._history = OrderedDict()
+
+    async def user_name(self, user_id: str | None) -> str:
+        if not user_id:
+            return "Unknown"
+        if user_id in self._users:
+            self._users.move_to_end(user_id)
+            return self._users[user_id]
+        user = await self.hass.auth.async_get_user(user_id)
+        name = user.name if user and user.name else "Unknown"
+        self._users[user_id] = name
+        while len(self._users) > MAX_CACHED_USERS:
+            self._users.popitem(last=False)
+        return name
+
+    def history(self, conversation_id: str) -> list:
+        entry = self._history.get(conversation_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._history.pop(conversation_id, None)
+            return []
+        self._history.move_to_end(conversation_id)
+        return list(entry[1])
+
+    def remember(self, conversation_id: str, text: str, reply: str) -> None:
+        # Failed turns would only confuse the next answer
+        if not reply or reply == ERROR_REPLY or reply.startswith("Error:"):
+            return
+        entry = self._history.get(conversation_id)
+        turns = entry[1] if entry else deque(maxlen=MAX_HISTORY_MESSAGES)
+        turns.append({"role": "user", "content": text})
+        turns.append({"role": "assistant", "content": reply})
+        self._history[conversation_id] = (time.monotonic() + HISTORY_TTL, turns)
+        self._history.move_to_end(conversation_id)
+        while len(self._history) > MAX_CONVERSATIONS:
+            self._history.popitem(last=False)
+
+    async def payload(self, user_input: conversation.ConversationInput, conversation_id: str) -> dict:
+        # We send both ID (for strict auth if needed) and Name (for the AI)
+        return {
+            "user_id": user_input.context.user_id,
+            "user_name": await self.user_name(user_input.context.user_id),
+            "text": user_input.text,
+            "conversation_id": conversation_id,
+            "history": self.history(conversation_id),
+        }
+
+    async def ask(self, payload: dict) -> str:
+        """Whole answer in one response."""
+        try:
+            async with self.session.post(self.url, json=payload, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as resp:
+                if resp.status != 200:
+                    return f"Error: Brain returned status {resp.status}"
+                data = await resp.json()
+                return data.get("response", "No response from brain.")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"Failed to connect to Hearth: {e}")
+            return ERROR_REPLY
+
+    async def stream(self, payload: dict):
+        """
+        Yield the answer from the Server-Sent Events of /chat/stream.
+        The bot can `reset` (drop) text it already streamed, e.g. a preamble to
+        a tool call or an attempt that failed over, at any point until `done`;
+        anything yielded here is spoken and can't be taken back, so deltas are
+        buffered and only the final text is released.
+        """
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+        try:
+            async with self.session.post(f"{self.url}/stream", json=payload, timeout=timeout) as resp:
+                if resp.status == 404:
+                    # Older bot without the streaming route
+                    yield await self.ask(payload)
+                    return
+                if resp.status != 200:
+                    yield f"Error: Brain returned status {resp.status}"
+                    return
+                buffered = ""
+                event = None
+                async for raw in resp.content:
+                    line = raw.decode("utf-8").rstrip("\n")
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        data = json.loads(line[6:])
+                        if event == "delta" and data.get("text"):
+                            buffered += data["text"]
+                        elif event == "reset":
+                            buffered = ""
+                        elif event == "done":
+                            # The final reply is authoritative (errors and cached replies never stream)
+                            text = data.get("response", buffered)
+                            if text:
+                                yield text
+                            return
+                # Connection closed before `done`: whatever was buffered may have been dropped
+                _LOGGER.error("Hearth stream ended without a final reply")
+                yield ERROR_REPLY
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"Failed to stream from Hearth: {e}")
+            yield ERROR_REPLY
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> None:
+    """Conversation platform (streaming-capable HA versions)."""
+    backend = hass.data[DOMAIN][entry.entry_id]
+    async_add_entities([HearthConversationEntity(entry, backend)])
+
+
+if STREAMING_SUPPORTED:
+
+    class HearthConversationEntity(conversation.ConversationEntity):
+        """Hearth agent that answers through the chat log (and on to TTS)."""
+
+        _attr_has_entity_name = True
+        _attr_name = None
+        _attr_supports_streaming = True
+
+        def __init__(self, entry: ConfigEntry, backend: HearthBackend) -> None:
+            self.entry = entry
+            self.backend = backend
+            self._attr_unique_id = entry.entry_id
+
+        @property
+        def supported_languages(self) -> list[str]:
+            return ["en"]
+
+        async def _async_handle_message(
+            self, user_input: conversation.ConversationInput, chat_log: conversation.ChatLog
+        ) -> conversation.ConversationResult:
+            conversation_id = chat_log.conversation_id
+            payload = await self.backend.payload(user_input, conversation_id)
+            _LOGGER.debug(f"Streaming from Hearth ({self.backend.url}) for {payload['user_name']}: {user_input.text}")
+
+            async def deltas():
+                yield {"role": "assistant"}
+                async for text in self.backend.stream(payload):
+                    yield {"content": text}
+
+            reply = ""
+            async for content in chat_log.async_add_delta_content_stream(self.entity_id, deltas()):
+                if getattr(content, "content", None):
+                    reply = content.content
+            self.backend.remember(conversation_id, user_input.text, reply)
+            return conversation.async_get_result_from_chat_log(user_input, chat_log)
 
-async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    """Unload a config entry."""
-    conversation.async_unset_agent(hass, entry)
-    return True
 
 class HearthConversationAgent(conversation.AbstractConversationAgent):
-    """Hearth Conversation Agent."""
+    """Hearth Conversation Agent (non-streaming, for HA versions without chat logs)."""
 
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, backend: HearthBackend | None = None) -> None:
         self.hass = hass
         self.entry = entry
-        self.history = {}
+        self.backend = backend or HearthBackend(hass, entry.data.get(CONF_URL, DEFAULT_URL))
 
     @property
     def supported_languages(self) -> list[str]:
@@ -42,43 +210,18 @@ class HearthConversationAgent(conversation.AbstractConversationAgent):
         self, user_input: conversation.ConversationInput
     ) -> conversation.ConversationResult:
         """Process a sentence."""
-        url = self.entry.data.get(CONF_URL, DEFAULT_URL)
-        text = user_input.text
-        user_id = user_input.context.user_id or "system"
-
-        # Resolve User Name from Registry
-        user_name = "Unknown"
-        if user_input.context.user_id:
-            user = await self.hass.auth.async_get_user(user_input.context.user_id)
-            if user:
-                user_name = user.name
-
-        _LOGGER.debug(f"Sending to Hearth ({url}) from {user_name}: {text}")
-
-        # Call the Hearth API
-        async with aiohttp.ClientSession() as session:
-            try:
-                # We send both ID (for strict auth if needed) and Name (for the AI)
-                payload = {
-                    "user_id": user_input.context.user_id,
-                    "user_name": user_name, 
-                    "text": text
-                }
-                async with session.post(url, json=payload, timeout=60) as resp:
-                    if resp.status != 200:
-                        response_text = f"Error: Brain returned status {resp.status}"
-                    else:
-                        data = await resp.json()
-                        response_text = data.get("response", "No response from brain.")
-            except Exception as e:
-                _LOGGER.error(f"Failed to connect to Hearth: {e}")
-                response_text = "I can't reach my brain right now."
+        # Keep the caller's conversation going, or start one so follow-ups have context
+        conversation_id = user_input.conversation_id or ulid_util.ulid_now()
+        payload = await self.backend.payload(user_input, conversation_id)
+        _LOGGER.debug(f"Sending to Hearth ({self.backend.url}) from {payload['user_name']}: {user_input.text}")
+
+        response_text = await self.backend.ask(payload)
+        self.backend.remember(conversation_id, user_input.text, response_text)
 
         # Return the result in HA format
-        intent_response = conversation.ConversationResult(
-            response=conversation.ConversationResponse(
-                speech={"plain": {"speech": response_text, "extra_data": None}}
-            ),
-            conversation_id=user_input.conversation_id,
+        intent_response = intent.IntentResponse(language=user_input.language)
+        intent_response.async_set_speech(response_text)
+        return conversation.ConversationResult(
+            response=intent_response,
+            conversation_id=conversation_id,
         )
-        return intent_response
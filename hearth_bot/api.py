@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import logging
+import time
+from aiohttp import web
+from services import pipeline
+from services.tools import request_context
+from services.scheduler import Superseded
+from services.ai import is_error_reply
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# HTTP API for the Home Assistant conversation agent (ha_components/hearth_assistant)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Optional shared secret: clients send "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("API_TOKEN")
+# Requests answered at once; the rest wait up to API_QUEUE_TIMEOUT for a slot
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "4"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "5"))
+API_REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT", "60"))
+API_KEEPALIVE = 75.0
+MAX_HISTORY_TURNS = 20
+
+NO_SEARCH_REPLY = "I'd need to search the web for that. Ask me on Telegram and I'll check."
+TIMEOUT_REPLY = "Sorry, that's taking too long. Please try again."
+
+class SSEStream:
+    """Streamer interface (push/reset/set_status) over a Server-Sent Events response."""
+    def __init__(self, response: web.StreamResponse):
+        self.response = response
+
+    async def _send(self, event: str, data: dict):
+        await self.response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    async def push(self, chunk: str):
+        await self._send("delta", {"text": chunk})
+
+    async def reset(self, status: str = None):
+        # Partial text so far was tool-call preamble; clients drop it
+        await self._send("reset", {"status": status})
+
+    async def set_status(self, status: str = None):
+        await self._send("status", {"status": status})
+
+def _parse(payload: dict):
+    """(text, user_id, user_name, conversation_id, history) from a /chat body."""
+    text = (payload.get("text") or "").strip()
+    history = payload.get("history")
+    if history is not None:
+        history = [
+            {"role": turn["role"], "content": str(turn["content"])}
+            for turn in history[-MAX_HISTORY_TURNS:]
+            if isinstance(turn, dict) and turn.get("role") in ("user", "assistant") and turn.get("content")
+        ]
+    return text, payload.get("user_id"), payload.get("user_name"), payload.get("conversation_id"), history
+
+async def _answer(text, user_id, user_name, conversation_id, history, stream=None) -> str:
+    # Memory facts and scheduler fairness are keyed on the HA user
+    request_context.set({"user": user_id, "source": "home_assistant"} if user_id else {"source": "home_assistant"})
+    # Client-supplied history wins; otherwise the store keeps it per HA conversation
+    chat_key = None if history is not None else f"ha:{conversation_id or user_id or 'default'}"
+    started = time.perf_counter()
+    path = "fast"
+    try:
+        quick = await pipeline.fast_path(text, chat_key)
+        if quick:
+            if stream:
+                await stream.push(quick)
+            return quick
+        path = "llm"
+        reply = await pipeline.ask(text, chat_key, stream=stream, history=history, speaker=user_name)
+        if reply.startswith("__REQ_PERM__"):
+            path = "permission"
+            return NO_SEARCH_REPLY
+        return reply
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, source="home_assistant", path=path)
+
+def _authorized(request: web.Request) -> bool:
+    return not API_TOKEN or request.headers.get("Authorization") == f"Bearer {API_TOKEN}"
+
+async def _read(request: web.Request):
+    if not _authorized(request):
+        raise web.HTTPUnauthorized(text=json.dumps({"error": "unauthorized"}), content_type="application/json")
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        payload = None
+    if not isinstance(payload, dict) or not (payload.get("text") or "").strip():
+        raise web.HTTPBadRequest(text=json.dumps({"error": "text is required"}), content_type="application/json")
+    return _parse(payload)
+
+async def _slot(request: web.Request):
+    """Wait briefly for a worker slot; 503 when the bot is saturated."""
+    limit = request.app["limit"]
+    try:
+        await asyncio.wait_for(limit.acquire(), API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise web.HTTPServiceUnavailable(
+            text=json.dumps({"error": "busy", "response": "I'm busy right now, try again in a moment."}),
+            content_type="application/json",
+        )
+    return limit
+
+async def chat(request: web.Request) -> web.Response:
+    """POST /chat {text, user_id?, user_name?, conversation_id?, history?} -> {response, conversation_id}"""
+    text, user_id, user_name, conversation_id, history = await _read(request)
+    limit = await _slot(request)
+    try:
+        reply = await asyncio.wait_for(
+            _answer(text, user_id, user_name, conversation_id, history), API_REQUEST_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return web.json_response({"response": TIMEOUT_REPLY, "error": "timeout"}, status=504)
+    except Superseded:
+        return web.json_response({"response": "", "error": "superseded"}, status=409)
+    finally:
+        limit.release()
+    return web.json_response({
+        "response": reply,
+        "conversation_id": conversation_id,
+        "error": "llm" if is_error_reply(reply) else None,
+    })
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    """POST /chat/stream: same body; Server-Sent Events `delta`/`reset`/`status`, then `done` {response}."""
+    text, user_id, user_name, conversation_id, history = await _read(request)
+    limit = await _slot(request)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    try:
+        await response.prepare(request)
+        stream = SSEStream(response)
+        try:
+            reply = await asyncio.wait_for(
+                _answer(text, user_id, user_name, conversation_id, history, stream), API_REQUEST_TIMEOUT
+            )
+            await stream._send("done", {"response": reply, "conversation_id": conversation_id})
+        except asyncio.TimeoutError:
+            await stream._send("done", {"response": TIMEOUT_REPLY, "error": "timeout"})
+        except Superseded:
+            await stream._send("done", {"response": "", "error": "superseded"})
+        await response.write_eof()
+    except ConnectionResetError:
+        # Client went away (e.g. the voice pipeline was cancelled)
+        logger.info("API stream client disconnected")
+    finally:
+        limit.release()
+    return response
+
+async def health(request: web.Request) -> web.Response:
+    from services.state_store import store
+    from services.memory import memory
+    return web.json_response({"status": "ok", "home_assistant": store.ready, "memory": memory.ready})
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus text exposition (same bearer token as /chat when one is set)."""
+    if not _authorized(request):
+        raise web.HTTPUnauthorized(text=json.dumps({"error": "unauthorized"}), content_type="application/json")
+    return web.Response(text=metrics.render(), content_type="text/plain")
+
+def create_app() -> web.Application:
+    app = web.Application(client_max_size=64 * 1024)
+    app["limit"] = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+async def start() -> web.AppRunner:
+    """Serve the API on the running loop (alongside the Telegram poller)."""
+    runner = web.AppRunner(create_app(), keepalive_timeout=API_KEEPALIVE, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, API_HOST, API_PORT).start()
+    logger.info(f"🌐 API listening on {API_HOST}:{API_PORT}")
+    return runner
+
+async def stop(runner: web.AppRunner):
+    await runner.cleanup()
@@ -0,0 +1,401 @@
+"""
+Fake Ollama, Home Assistant and Telegram Bot API servers for the benchmark.
+
+Standalone (e.g. to point a dev bot at them):
+    python -m bench.fakes --entities 5000 --token-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_PORT = 18434
+HASS_PORT = 18123
+TELEGRAM_PORT = 18081
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# --- OLLAMA ---
+class FakeOllama:
+    """
+    /api/chat with canned answers. A user turn mentioning a keyword below gets a
+    tool call first (when tools are offered); the turn after a tool result gets the answer.
+    first_token_delay stands in for prompt evaluation, token_delay for generation.
+    """
+    TOOL_RULES = (
+        ("remember", "search_memory", lambda text: {"query": text}),
+        ("home", "check_home", lambda text: {}),
+        ("calendar", "get_calendar_events", lambda text: {}),
+    )
+    ANSWER = "Everything looks fine. The lights downstairs are off and the doors are locked for the night."
+
+    def __init__(self, first_token_delay: float = 0.2, token_delay: float = 0.02, answer_tokens: int = 40):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_get("/api/version", self.version)
+        return app
+
+    async def version(self, request):
+        return web.json_response({"version": "0.0.0-fake"})
+
+    def _tool_call(self, text: str):
+        lowered = text.lower()
+        for keyword, name, args in self.TOOL_RULES:
+            if keyword in lowered:
+                return {"function": {"name": name, "arguments": args(text)}}
+        return None
+
+    def _answer_tokens(self) -> list:
+        words = self.ANSWER.split()
+        return [words[i % len(words)] + " " for i in range(self.answer_tokens)]
+
+    async def chat(self, request):
+        self.requests += 1
+        body = await request.json()
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {}
+        tool_call = self._tool_call(last.get("content", "")) if body.get("tools") and last.get("role") == "user" else None
+        tokens = [] if tool_call else self._answer_tokens()
+        stats = {
+            "prompt_eval_count": sum(len(str(m.get("content", "")).split()) for m in messages),
+            "prompt_eval_duration": int(self.first_token_delay * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) * self.token_delay * 1e9),
+        }
+        await asyncio.sleep(self.first_token_delay)
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(tokens) * self.token_delay)
+            message = {"role": "assistant", "content": "".join(tokens)}
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            return web.json_response({"model": body.get("model"), "message": message, "done": True, **stats})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def send(chunk: dict):
+            await response.write((json.dumps({"model": body.get("model"), **chunk}) + "\n").encode("utf-8"))
+
+        if tool_call:
+            await send({"message": {"role": "assistant", "content": "", "tool_calls": [tool_call]}, "done": False})
+        for token in tokens:
+            await asyncio.sleep(self.token_delay)
+            await send({"message": {"role": "assistant", "content": token}, "done": False})
+        await send({"message": {"role": "assistant", "content": ""}, "done": True, **stats})
+        await response.write_eof()
+        return response
+
+# --- HOME ASSISTANT ---
+AREAS = ("Kitchen", "Living Room", "Bedroom", "Office", "Garage", "Hallway", "Garden", "Bathroom", "Nursery", "Attic")
+# domain -> (weight, [(device_class, states)])
+DOMAINS = {
+    "sensor": (40, [("temperature", None), ("humidity", None), ("power", None), ("battery", None)]),
+    "binary_sensor": (15, [("door", ("off", "on")), ("window", ("off", "on")), ("motion", ("off", "on"))]),
+    "light": (15, [(None, ("on", "off"))]),
+    "switch": (10, [(None, ("on", "off"))]),
+    "media_player": (5, [(None, ("off", "playing", "idle"))]),
+    "climate": (3, [(None, ("heat", "off"))]),
+    "lock": (4, [(None, ("locked", "locked", "unlocked"))]),
+    "cover": (4, [("garage", ("closed", "closed", "open")), ("blind", ("open", "closed"))]),
+    "automation": (4, [(None, ("on",))]),
+}
+# What a securing/control service leaves an entity in
+SERVICE_STATES = {
+    "lock": "locked", "unlock": "unlocked", "close_cover": "closed", "open_cover": "open",
+    "turn_on": "on", "turn_off": "off",
+}
+SECURING_SERVICES = {"lock", "close_cover"}
+
+class FakeHomeAssistant:
+    """
+    REST (/api/states, /api/calendars, /api/services) and WebSocket (auth,
+    state_changed, registries) over a generated house of N entities.
+    Service calls take effect after actuate_delay and are pushed as events.
+    Secured locks/covers swing back open after revert_after so repeated /sleep
+    runs keep having work to do (0 disables).
+    """
+    def __init__(self, entities: int = 2000, calendars: int = 3, events_per_calendar: int = 6,
+                 actuate_delay: float = 0.2, revert_after: float = 0.3, seed: int = 42):
+        self.actuate_delay = actuate_delay
+        self.revert_after = revert_after
+        self.events_per_calendar = events_per_calendar
+        self.states = {}
+        self.entity_areas = {}
+        self.sockets = set()
+        self.service_calls = 0
+        self._build(entities, calendars, random.Random(seed))
+
+    def _state(self, entity_id: str, state: str, attributes: dict) -> dict:
+        now = _now_iso()
+        return {"entity_id": entity_id, "state": state, "attributes": attributes,
+                "last_changed": now, "last_updated": now, "context": {"id": entity_id}}
+
+    def _build(self, entities: int, calendars: int, rng: random.Random):
+        domains = list(DOMAINS)
+        weights = [DOMAINS[d][0] for d in domains]
+        for i in range(entities):
+            domain = rng.choices(domains, weights)[0]
+            device_class, states = rng.choice(DOMAINS[domain][1])
+            area = AREAS[i % len(AREAS)]
+            kind = (device_class or domain).replace("_", " ").title()
+            entity_id = f"{domain}.{area.lower().replace(' ', '_')}_{kind.lower().replace(' ', '_')}_{i}"
+            attributes = {"friendly_name": f"{area} {kind} {i}"}
+            if device_class:
+                attributes["device_class"] = device_class
+            if states is None:
+                state = f"{rng.uniform(0, 100):.1f}"
+                attributes["unit_of_measurement"] = {"temperature": "°C", "humidity": "%", "power": "W"}.get(device_class, "%")
+            else:
+                state = rng.choice(states)
+            self.states[entity_id] = self._state(entity_id, state, attributes)
+            self.entity_areas[entity_id] = area.lower().replace(" ", "_")
+        for i in range(calendars):
+            eid = f"calendar.family_{i}"
+            self.states[eid] = self._state(eid, "off", {"friendly_name": f"Family {i}"})
+        for scene in ("morning", "sleep"):
+            eid = f"scene.{scene}"
+            self.states[eid] = self._state(eid, "scening", {"friendly_name": scene.title()})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 * 1024)
+        app.router.add_get("/api/", self.root)
+        app.router.add_get("/api/states", self.all_states)
+        app.router.add_get("/api/states/{entity_id}", self.one_state)
+        app.router.add_get("/api/calendars/{entity_id}", self.calendar)
+        app.router.add_post("/api/services/{domain}/{service}", self.service)
+        app.router.add_get("/api/websocket", self.websocket)
+        return app
+
+    async def root(self, request):
+        return web.json_response({"message": "API running."})
+
+    async def all_states(self, request):
+        return web.json_response(list(self.states.values()))
+
+    async def one_state(self, request):
+        state = self.states.get(request.match_info["entity_id"])
+        if state is None:
+            return web.json_response({"message": "Entity not found."}, status=404)
+        return web.json_response(state)
+
+    async def calendar(self, request):
+        cal_id = request.match_info["entity_id"]
+        start = datetime.now().replace(hour=7, minute=0, second=0, microsecond=0)
+        events = [
+            {"summary": f"{cal_id.split('.')[1].title()} event {n}",
+             "start": {"dateTime": (start + timedelta(hours=n * 2)).isoformat()},
+             "end": {"dateTime": (start + timedelta(hours=n * 2, minutes=30)).isoformat()}}
+            for n in range(self.events_per_calendar)
+        ]
+        return web.json_response(events)
+
+    async def service(self, request):
+        self.service_calls += 1
+        service = request.match_info["service"]
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            payload = {}
+        entity_ids = payload.get("entity_id") or []
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        target = SERVICE_STATES.get(service)
+        if target:
+            for eid in entity_ids:
+                if eid in self.states:
+                    asyncio.get_running_loop().call_later(self.actuate_delay, self._set, eid, target)
+                    if service in SECURING_SERVICES and self.revert_after > 0:
+                        undo = "unlocked" if eid.startswith("lock.") else "open"
+                        asyncio.get_running_loop().call_later(self.actuate_delay + self.revert_after, self._set, eid, undo)
+        return web.json_response([self.states[eid] for eid in entity_ids if eid in self.states])
+
+    def _set(self, entity_id: str, state: str):
+        old = self.states[entity_id]
+        if old["state"] == state:
+            return
+        new = self._state(entity_id, state, old["attributes"])
+        self.states[entity_id] = new
+        event = {"event_type": "state_changed", "data": {"entity_id": entity_id, "old_state": old, "new_state": new}}
+        for ws, sub_id in list(self.sockets):
+            asyncio.ensure_future(self._send(ws, {"id": sub_id, "type": "event", "event": event}))
+
+    async def _send(self, ws, msg: dict):
+        try:
+            await ws.send_json(msg)
+        except ConnectionResetError:
+            pass
+
+    def _registries(self) -> dict:
+        areas = sorted(set(self.entity_areas.values()))
+        return {
+            "config/area_registry/list": [{"area_id": a, "name": a.replace("_", " ").title()} for a in areas],
+            "config/device_registry/list": [],
+            "config/entity_registry/list": [{"entity_id": eid, "area_id": area, "device_id": None}
+                                            for eid, area in self.entity_areas.items()],
+        }
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        await ws.send_json({"type": "auth_required", "ha_version": "fake"})
+        subscription = None
+        try:
+            async for raw in ws:
+                if raw.type != WSMsgType.TEXT:
+                    continue
+                msg = raw.json()
+                kind = msg.get("type")
+                if kind == "auth":
+                    await ws.send_json({"type": "auth_ok", "ha_version": "fake"})
+                elif kind == "subscribe_events":
+                    subscription = (ws, msg["id"])
+                    self.sockets.add(subscription)
+                    await ws.send_json({"id": msg["id"], "type": "result", "success": True, "result": None})
+                else:
+                    result = self._registries().get(kind)
+                    await ws.send_json({"id": msg.get("id"), "type": "result", "success": True, "result": result})
+        finally:
+            self.sockets.discard(subscription)
+        return ws
+
+# --- TELEGRAM ---
+class FakeTelegram:
+    """
+    Bot API subset: getUpdates (long poll), sendMessage/editMessageText (echo a
+    Message), everything else returns True. The driver injects user messages via
+    POST /bench/message {user_id, text}.
+    """
+    def __init__(self):
+        self.updates = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.calls = {}
+        self._arrived = asyncio.Event()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bench/message", self.inject)
+        app.router.add_get("/bench/stats", self.stats)
+        app.router.add_route("*", "/bot{token}/{method}", self.method)
+        return app
+
+    def _chat(self, chat_id) -> dict:
+        return {"id": int(chat_id), "type": "private", "first_name": f"User {chat_id}"}
+
+    async def inject(self, request):
+        body = await request.json()
+        user_id = int(body["user_id"])
+        text = body["text"]
+        message = {
+            "message_id": self._message_id(),
+            "date": int(time.time()),
+            "chat": self._chat(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        update = {"update_id": self.next_update_id, "message": message}
+        self.next_update_id += 1
+        self.updates.append(update)
+        self._arrived.set()
+        return web.json_response({"update_id": update["update_id"]})
+
+    async def stats(self, request):
+        return web.json_response(self.calls)
+
+    def _message_id(self) -> int:
+        self.next_message_id += 1
+        return self.next_message_id
+
+    async def method(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post())
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Hearth", "username": "hearth_bench_bot"})
+        if method.startswith("send") and method != "sendChatAction" or method == "editMessageText":
+            return self._ok({
+                "message_id": int(params.get("message_id") or self._message_id()),
+                "date": int(time.time()),
+                "chat": self._chat(params.get("chat_id", 0)),
+                "text": params.get("text", ""),
+            })
+        return self._ok(True)
+
+    def _ok(self, result):
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        # Confirmed updates are dropped, as the real API does
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+async def serve(ollama: FakeOllama, hass: FakeHomeAssistant, telegram: FakeTelegram,
+                host: str = "127.0.0.1", ports: tuple = (OLLAMA_PORT, HASS_PORT, TELEGRAM_PORT)) -> list:
+    """Start all three on the running loop; returns their runners for cleanup."""
+    runners = []
+    for fake, port in zip((ollama, hass, telegram), ports):
+        runner = web.AppRunner(fake.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+    return runners
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--entities", type=int, default=2000, help="Home Assistant entities to generate")
+    parser.add_argument("--calendars", type=int, default=3)
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Fake prompt evaluation time (s)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Fake time per generated token (s)")
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--actuate-delay", type=float, default=0.2, help="Time for a lock/cover to report its new state (s)")
+    parser.add_argument("--revert-after", type=float, default=0.3, help="Secured locks/covers reopen after this (s, 0 = never)")
+    parser.add_argument("--ollama-port", type=int, default=OLLAMA_PORT)
+    parser.add_argument("--hass-port", type=int, default=HASS_PORT)
+    parser.add_argument("--telegram-port", type=int, default=TELEGRAM_PORT)
+
+def from_arguments(args) -> tuple:
+    return (
+        FakeOllama(args.first_token_delay, args.token_delay, args.answer_tokens),
+        FakeHomeAssistant(args.entities, args.calendars, actuate_delay=args.actuate_delay, revert_after=args.revert_after),
+        FakeTelegram(),
+    )
+
+async def _main(args):
+    ollama, hass, telegram = from_arguments(args)
+    await serve(ollama, hass, telegram, ports=(args.ollama_port, args.hass_port, args.telegram_port))
+    logger.info(f"Fakes up: ollama :{args.ollama_port}, home assistant :{args.hass_port} "
+                f"({len(hass.states)} entities), telegram :{args.telegram_port}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,270 @@
+"""
+Benchmark harness: the real bot (dispatcher, handlers, services) against fake
+Ollama, Home Assistant and Telegram servers (bench/fakes.py, run in a child
+process so the RSS below is the bot's own).
+
+    cd hearth_bot && python -m bench.run --users 8 --requests 20 --entities 5000
+
+Each synthetic user sends its next message as soon as the previous one is
+handled. Reports p50/p95/p99 latency, throughput and RSS per scenario.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from bench import fakes
+
+USER_BASE = 1000
+TOPICS = ("the school run", "the boiler service", "grandma's birthday", "the wifi password", "bin day")
+
+# Chat texts are unique per request so the response cache doesn't answer them
+SCENARIOS = {
+    "morning": lambda user, i: "/morning",
+    "sleep": lambda user, i: "/sleep",
+    "check_home": lambda user, i: f"What's going on at home right now? ({user}.{i})",
+    "memory": lambda user, i: f"What do you remember about {TOPICS[i % len(TOPICS)]}? ({user}.{i})",
+}
+
+SEED_FACTS = [
+    "The school run is at 8:15 on weekdays.",
+    "The boiler was serviced in March; next service is due in March next year.",
+    "Grandma's birthday is on the 14th of June.",
+    "The guest wifi password is on the fridge.",
+    "Bin day is Tuesday; recycling goes out every other week.",
+]
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+def _configure(args, data_dir: str):
+    """Point the bot at the fakes. Must run before any bot module is imported."""
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.telegram_port}",
+        "ADMIN_ID": str(USER_BASE),
+        "HASS_URL": f"http://127.0.0.1:{args.hass_port}",
+        "HASS_TOKEN": "bench",
+        "OLLAMA_URL": f"http://127.0.0.1:{args.ollama_port}/api/chat",
+        "AI_PROVIDER": "ollama",
+        # Set (empty) so a developer's .env can't pull the cloud model in
+        "GEMINI_API_KEY": "",
+        "HEARTH_DATA_DIR": data_dir,
+    })
+
+async def _wait_for_fakes(args, timeout: float = 30):
+    urls = [
+        f"http://127.0.0.1:{args.ollama_port}/api/version",
+        f"http://127.0.0.1:{args.hass_port}/api/",
+        f"http://127.0.0.1:{args.telegram_port}/bench/stats",
+    ]
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        for url in urls:
+            while True:
+                try:
+                    async with session.get(url) as resp:
+                        if resp.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Fake server at {url} did not come up")
+                await asyncio.sleep(0.2)
+
+class Driver:
+    """Injects messages through the fake Telegram and times them until the handler returns."""
+    def __init__(self, telegram_url: str, session: aiohttp.ClientSession, timeout: float):
+        self.telegram_url = telegram_url
+        self.session = session
+        self.timeout = timeout
+        self._pending = {}  # user id -> future(error or None); one message in flight per user
+
+    async def middleware(self, handler, event, data):
+        """dp.update outer middleware: resolves the sender's pending future when handling ends."""
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            user = event.message.from_user.id if event.message and event.message.from_user else None
+            future = self._pending.pop(user, None)
+            if future and not future.done():
+                future.set_result(error)
+
+    async def send(self, user: int, text: str) -> tuple:
+        """(latency seconds, error or None) for one message."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[user] = future
+        started = time.perf_counter()
+        async with self.session.post(f"{self.telegram_url}/bench/message", json={"user_id": user, "text": text}) as resp:
+            resp.raise_for_status()
+        try:
+            error = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(user, None)
+            error = TimeoutError(f"no answer within {self.timeout:g}s")
+        return time.perf_counter() - started, error
+
+async def run_scenario(driver: Driver, name: str, users: int, requests: int, warmup: int) -> dict:
+    make_text = SCENARIOS[name]
+    # Indices past the measured range keep warm-up texts distinct
+    for i in range(warmup):
+        await driver.send(USER_BASE, make_text(USER_BASE, requests + i))
+
+    latencies, errors = [], []
+
+    async def user_loop(user: int):
+        for i in range(requests):
+            latency, error = await driver.send(user, make_text(user, i))
+            (errors if error else latencies).append(error or latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[user_loop(USER_BASE + u) for u in range(users)])
+    elapsed = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "first_error": str(errors[0]) if errors else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def _print_table(results: list, boot: dict):
+    print(f"\nBoot: {boot['seconds']:.2f}s, RSS {boot['rss_mb']:.0f} MB ({boot['entities']} HA entities)")
+    header = f"{'scenario':<12}{'reqs':>6}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'RSS MB':>9}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<12}{r['requests']:>6}{r['errors']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['throughput_rps']:>9.2f}{r['rss_mb']:>9.0f}{r['peak_rss_mb']:>9.0f}")
+        if r["first_error"]:
+            print(f"  first error: {r['first_error']}")
+
+async def main(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="hearth-bench-")
+    _configure(args, data_dir)
+    fake_args = [
+        "--entities", str(args.entities), "--calendars", str(args.calendars),
+        "--first-token-delay", str(args.first_token_delay), "--token-delay", str(args.token_delay),
+        "--answer-tokens", str(args.answer_tokens), "--actuate-delay", str(args.actuate_delay),
+        "--revert-after", str(args.revert_after), "--ollama-port", str(args.ollama_port),
+        "--hass-port", str(args.hass_port), "--telegram-port", str(args.telegram_port),
+    ]
+    server = subprocess.Popen([sys.executable, "-m", "bench.fakes", *fake_args],
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        await _wait_for_fakes(args)
+        return await _bench(args)
+    finally:
+        server.terminate()
+        server.wait()
+
+async def _bench(args) -> list:
+    # Bot modules read their settings at import time, so import only now
+    boot_started = time.perf_counter()
+    import main as bot_main
+    from database import init_db, close_db, approve_user
+    from services import hass, executor, metrics
+    from services.state_store import store
+    from services.memory import memory
+    from services.providers import providers
+
+    await init_db()
+    for u in range(args.users):
+        await approve_user(USER_BASE + u)
+    await hass.client.start()
+    await store.start(hass.client)
+    memory.start()
+    providers.start()
+    bot = bot_main.create_bot()
+    dp = bot_main.create_dispatcher(bot)
+
+    scenarios = list(SCENARIOS) if args.scenario == ["all"] else args.scenario
+    if "memory" in scenarios:
+        # Warm-up also "finishes" when loading failed; the collection tells them apart
+        if await memory.wait_ready(timeout=args.memory_timeout) and memory.collection:
+            await executor.run_cpu(memory.save_facts, SEED_FACTS)
+        else:
+            print("Memory did not warm up (sentence-transformers/chromadb missing?); skipping the memory scenario.")
+            scenarios.remove("memory")
+    # Let the WebSocket mirror go live so reads come from memory, as in production
+    for _ in range(50):
+        if store.ready:
+            break
+        await asyncio.sleep(0.1)
+    boot = {"seconds": time.perf_counter() - boot_started, "rss_mb": rss_mb(), "entities": len(store.states)}
+
+    results = []
+    async with aiohttp.ClientSession() as session:
+        driver = Driver(f"http://127.0.0.1:{args.telegram_port}", session, args.timeout)
+        dp.update.outer_middleware(driver.middleware)
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+        try:
+            for name in scenarios:
+                results.append(await run_scenario(driver, name, args.users, args.requests, args.warmup))
+        finally:
+            await dp.stop_polling()
+            await polling
+            await bot.session.close()
+            memory.flush()
+            await providers.stop()
+            await store.stop()
+            await hass.client.close()
+            await close_db()
+            executor.shutdown()
+
+    _print_table(results, boot)
+    if args.stages:
+        print()
+        print(metrics.summary())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"boot": boot, "args": vars(args), "results": results}, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", default=["all"], choices=["all", *SCENARIOS])
+    parser.add_argument("--users", type=int, default=4, help="Concurrent synthetic users")
+    parser.add_argument("--requests", type=int, default=10, help="Messages per user per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured messages before each scenario")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-message timeout (s)")
+    parser.add_argument("--memory-timeout", type=float, default=120, help="Wait for the embedding model (s)")
+    parser.add_argument("--data-dir", help="Bot data directory (default: a fresh temp dir)")
+    parser.add_argument("--stages", action="store_true", help="Also print the per-stage latency summary")
+    parser.add_argument("--json", help="Write results to this file (for comparing runs)")
+    fakes.add_arguments(parser)
+    args = parser.parse_args()
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
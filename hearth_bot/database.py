@@ -1,58 +1,141 @@
 import aiosqlite
+import asyncio
+import os
 import logging
+from services.metrics import DB_SECONDS
 
-DB_NAME = "/app/hearth_data/hearth.db"
+DATA_DIR = os.getenv("HEARTH_DATA_DIR", "/app/hearth_data")
+DB_NAME = os.path.join(DATA_DIR, "hearth.db")
+
+# Statements are kept as constants so sqlite's statement cache reuses the compiled form
+SQL_GET_CONFIG = "SELECT key, value FROM family_config"
+SQL_SET_CONFIG = "INSERT OR REPLACE INTO family_config (key, value) VALUES (?, ?)"
+SQL_GET_USERS = "SELECT telegram_id, approved FROM users"
+SQL_APPROVE_USER = "INSERT OR REPLACE INTO users (telegram_id, role, approved) VALUES (?, 'admin', 1)"
+SQL_ADD_TURN = "INSERT INTO conversation_turns (chat_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)"
+SQL_GET_TURNS = "SELECT id, role, content, tokens FROM conversation_turns WHERE chat_id = ? AND id > ? ORDER BY id"
+SQL_DELETE_TURNS = "DELETE FROM conversation_turns WHERE chat_id = ? AND id <= ?"
+SQL_GET_SUMMARY = "SELECT summary, upto_id FROM conversation_summaries WHERE chat_id = ?"
+SQL_SET_SUMMARY = "INSERT OR REPLACE INTO conversation_summaries (chat_id, summary, upto_id) VALUES (?, ?, ?)"
+
+# Single long-lived connection + write-through caches (filled by init_db)
+_db = None
+_write_lock = asyncio.Lock()
+_config_cache = {}
+_allowed_users = set()
+config_revision = 0
 
 async def init_db():
-    import os
+    global _db
     os.makedirs(os.path.dirname(DB_NAME), exist_ok=True)
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Family Config Table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS family_config (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
-        """)
-        # Family Members Table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS family_members (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                role TEXT,
-                birthdate TEXT
-            )
-        """)
-        # Users Table (Mapping Telegram ID to Family Member)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                telegram_id INTEGER PRIMARY KEY,
-                role TEXT DEFAULT 'guest',
-                approved BOOLEAN DEFAULT 0
-            )
-        """)
-        await db.commit()
+    _db = await aiosqlite.connect(DB_NAME)
+    # WAL: readers never block on the writer; NORMAL sync is safe with WAL
+    await _db.execute("PRAGMA journal_mode=WAL")
+    await _db.execute("PRAGMA synchronous=NORMAL")
+
+    # Family Config Table
+    await _db.execute("""
+        CREATE TABLE IF NOT EXISTS family_config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    # Family Members Table
+    await _db.execute("""
+        CREATE TABLE IF NOT EXISTS family_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            role TEXT,
+            birthdate TEXT
+        )
+    """)
+    # Users Table (Mapping Telegram ID to Family Member)
+    await _db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            telegram_id INTEGER PRIMARY KEY,
+            role TEXT DEFAULT 'guest',
+            approved BOOLEAN DEFAULT 0
+        )
+    """)
+    # Conversation Memory (per chat turns + rolling summary of evicted turns)
+    await _db.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            created_at REAL
+        )
+    """)
+    await _db.execute("CREATE INDEX IF NOT EXISTS idx_turns_chat ON conversation_turns (chat_id, id)")
+    await _db.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            chat_id TEXT PRIMARY KEY,
+            summary TEXT,
+            upto_id INTEGER DEFAULT 0
+        )
+    """)
+    await _db.commit()
+
+    # Warm the caches: both tables are tiny
+    async with _db.execute(SQL_GET_CONFIG) as cursor:
+        _config_cache.update({key: value async for key, value in cursor})
+    async with _db.execute(SQL_GET_USERS) as cursor:
+        _allowed_users.update({tid async for tid, approved in cursor if approved})
     logging.info("Database initialized.")
 
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
 async def get_config(key: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT value FROM family_config WHERE key = ?", (key,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+    return _config_cache.get(key)
 
 async def set_config(key: str, value: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT OR REPLACE INTO family_config (key, value) VALUES (?, ?)", (key, value))
-        await db.commit()
+    global config_revision
+    async with _write_lock:
+        await _db.execute(SQL_SET_CONFIG, (key, value))
+        await _db.commit()
+    _config_cache[key] = value
+    config_revision += 1
 
 async def is_user_allowed(telegram_id: int) -> bool:
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT approved FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
-            row = await cursor.fetchone()
-            return bool(row[0]) if row else False
+    return telegram_id in _allowed_users
 
 async def approve_user(telegram_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT OR REPLACE INTO users (telegram_id, role, approved) VALUES (?, 'admin', 1)", (telegram_id,))
-        await db.commit()
+    async with _write_lock:
+        await _db.execute(SQL_APPROVE_USER, (telegram_id,))
+        await _db.commit()
+    _allowed_users.add(telegram_id)
+
+async def add_turn(chat_id: str, role: str, content: str, tokens: int) -> int:
+    import time
+    async with _write_lock:
+        with DB_SECONDS.time(op="add_turn"):
+            cursor = await _db.execute(SQL_ADD_TURN, (chat_id, role, content, tokens, time.time()))
+            await _db.commit()
+    return cursor.lastrowid
+
+async def get_turns(chat_id: str, after_id: int = 0) -> list:
+    """Turns newer than after_id as (id, role, content, tokens), oldest first."""
+    with DB_SECONDS.time(op="get_turns"):
+        async with _db.execute(SQL_GET_TURNS, (chat_id, after_id)) as cursor:
+            return list(await cursor.fetchall())
+
+async def get_summary(chat_id: str):
+    """Returns (summary, upto_id) or (None, 0)."""
+    with DB_SECONDS.time(op="get_summary"):
+        async with _db.execute(SQL_GET_SUMMARY, (chat_id,)) as cursor:
+            row = await cursor.fetchone()
+            return (row[0], row[1]) if row else (None, 0)
 
+async def set_summary(chat_id: str, summary: str, upto_id: int):
+    """Store the rolling summary and drop the turns it now covers."""
+    async with _write_lock:
+        with DB_SECONDS.time(op="set_summary"):
+            await _db.execute(SQL_SET_SUMMARY, (chat_id, summary, upto_id))
+            await _db.execute(SQL_DELETE_TURNS, (chat_id, upto_id))
+            await _db.commit()
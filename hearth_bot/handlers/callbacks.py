@@ -1,6 +1,7 @@
 from aiogram import Router, F, types
 from services.ai import ask_llm
-from services.tools import execute_tool # We can reuse this or import DDGS
+from services.scheduler import PRIORITY_COMMAND
+from services.tools import search_web
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,12 +18,9 @@ async def approve_search(callback: types.CallbackQuery):
     
     await callback.message.edit_text(f"🔍 Searching for: {query}...")
     
-    # 1. Execute Search Manually
-    # We call the tool function directly or via execute_tool logic
-    from duckduckgo_search import DDGS
+    # 1. Execute Search Manually (runs on the IO pool, not the event loop)
     try:
-        results = DDGS().text(query, max_results=3)
-        search_result = str(results)
+        search_result = await search_web(query)
     except Exception as e:
         search_result = f"Error: {e}"
         
@@ -38,7 +36,8 @@ async def approve_search(callback: types.CallbackQuery):
     # We don't have the original user message text here easily (stateless).
     # But usually the query IS the intent.
     
-    response = await ask_llm("Summarize the results.", system_prompt=system_prompt)
+    # The user is waiting on an answer they just approved; don't make them queue behind chat
+    response = await ask_llm("Summarize the results.", system_prompt=system_prompt, priority=PRIORITY_COMMAND)
     
     await callback.message.answer(response)
     await callback.answer()
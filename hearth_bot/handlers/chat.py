@@ -1,7 +1,11 @@
-from services.ai import ask_llm
-from database import get_config
+from services.streaming import TelegramStreamer, StatusMessage, STREAM_REPLIES
+from services.tools import request_context
+from services.scheduler import Superseded
+from services import pipeline
+from services.metrics import REQUEST_SECONDS, STAGE_SECONDS
 from aiogram import Router, types
 import logging
+import time
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -19,36 +23,54 @@ async def chat_handler(message: types.Message):
 
     user_text = message.text or ""
     
-    # Context Loading
-    fam_name = await get_config("family_name") or "Family"
-    parents = await get_config("parents") or "Parents"
+    # Tool context: memory facts are tagged with (and filterable by) their author
+    request_context.set({"user": user_id, "source": "telegram"})
     
-    from datetime import datetime
-    now_str = datetime.now().strftime("%Y-%m-%d %A")
+    chat_key = str(message.chat.id)
+    started = time.perf_counter()
+    path = "fast"
+    try:
+        path = await _respond(message, user_text, chat_key)
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, source="telegram", path=path)
 
-    # System Prompt Construction
-    system_prompt = (
-        f"You are Hearth, a helpful AI assistant for the {fam_name}.\n"
-        f"The parents are {parents}.\n"
-        f"Current Date: {now_str}.\n"
-        "Your goal is to be helpful, concise, and polite.\n"
-        "You have access to Long-Term Memory tools: 'remember_fact' and 'search_memory'.\n"
-        "- If the user tells you a fact (e.g. 'My gate code is 1234'), use 'remember_fact'.\n"
-        "- If asked a question you might know from the past, use 'search_memory'.\n"
-        "You also have access to the Internet via 'web_search' tool. Use it for current events/news.\n"
-        "If asked about the house or calendar, use the tools provided.\n"
-        "IMPORTANT: When asked for 'this week', calculate start_date=today and end_date=today+7 days.\n"
-        "When asked for 'tomorrow', use date+1.\n"
-        "Do not hallucinate calendar events."
-    )
+async def _respond(message: types.Message, user_text: str, chat_key: str) -> str:
+    """Answer one message; returns which path handled it (for metrics)."""
+    # Fast path: simple device commands/questions skip the LLM entirely
+    quick = await pipeline.fast_path(user_text, chat_key)
+    if quick:
+        with STAGE_SECONDS.time(stage="telegram_send"):
+            await message.reply(quick)
+        return "fast"
     
     await bot.send_chat_action(chat_id=message.chat.id, action="typing")
     
-    # Call AI (Agentic)
-    response = await ask_llm(user_text, system_prompt=system_prompt)
+    # Streaming: placeholder reply that fills in as tokens arrive
+    streamer = None
+    status = None
+    if STREAM_REPLIES:
+        streamer = TelegramStreamer(message)
+        with STAGE_SECONDS.time(stage="telegram_placeholder"):
+            await streamer.start()
+    else:
+        # Otherwise a plain message, only if the request has to queue
+        status = StatusMessage(message)
+    
+    # Call AI (Agentic); a newer message from the same user supersedes this one
+    try:
+        response = await pipeline.ask(user_text, chat_key, stream=streamer, status=status)
+    except Superseded:
+        if streamer:
+            await streamer.abort()
+        return "superseded"
+    finally:
+        if status:
+            await status.clear()
     
     # Check for Permission Request
     if response.startswith("__REQ_PERM__"):
+        if streamer:
+            await streamer.abort()
         query = response.split(":", 1)[1]
         from aiogram.utils.keyboard import InlineKeyboardBuilder
         builder = InlineKeyboardBuilder()
@@ -59,6 +81,11 @@ async def chat_handler(message: types.Message):
         builder.button(text="❌ Deny", callback_data="deny_search")
         
         await message.reply(f"🔒 I need permission to search for: \n`{query}`", reply_markup=builder.as_markup())
-        return
+        return "permission"
 
-    await message.reply(response)
+    with STAGE_SECONDS.time(stage="telegram_send"):
+        if streamer:
+            await streamer.finish(response)
+        else:
+            await message.reply(response)
+    return "llm"
@@ -1,29 +1,21 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from services import hass
-from services.ai import ask_llm
+from services import security
+from services.ai import complete
+from services.scheduler import PRIORITY_COMMAND
 import logging
-import json
-import re
-import asyncio
 from datetime import datetime, timedelta
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-def extract_json(text):
-    """Robust JSON extraction from LLM response"""
-    text = text.strip()
-    # Try finding first { and last }
-    match = re.search(r'(\{.*\})', text, re.DOTALL)
-    if match:
-        text = match.group(1)
-    return json.loads(text)
-
 from database import is_user_allowed, approve_user
 import os
 
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+# /sleep: add an LLM-written summary when something still needs attention
+SLEEP_AI_SUMMARY = os.getenv("SLEEP_AI_SUMMARY", "false").lower() == "true"
 
 @router.message(Command("id"))
 async def id_command(message: types.Message):
@@ -42,6 +34,14 @@ async def permit_command(message: types.Message):
     except:
         await message.reply("Usage: /permit <user_id>")
 
+@router.message(Command("stats"))
+async def stats_command(message: types.Message):
+    """Latency/queue summary (full series on the API's /metrics)"""
+    if message.from_user.id != ADMIN_ID:
+        return
+    from services import metrics
+    await message.reply(metrics.summary())
+
 @router.message(Command("sleep"))
 async def sleep_command(message: types.Message):
     """Trigger Sleep + AI Security Check"""
@@ -49,60 +49,46 @@ async def sleep_command(message: types.Message):
         return
 
     logger.info(f"User {message.from_user.id} triggered /sleep")
-    status_msg = await message.reply("🧠 AI Analyst starting up...")
+    status_msg = await message.reply("🔍 Checking locks and doors...")
     
     try:
-        # 1. Get Data
-        await status_msg.edit_text("🔍 Scanning home devices (~2s)...")
-        dashboard = await hass.get_security_dashboard()
-        
-        if not dashboard:
-            await status_msg.edit_text("⚠️ No security devices found to check (or HA Error).")
-             # Proceed to scene anyway?
+        # 1. Evaluate (rules + per-entity policy, no LLM)
+        states = await hass.get_states()
+        if not states:
+            await status_msg.edit_text("⚠️ Couldn't read device states (HA Error).")
         else:
-            size_kb = len(dashboard) / 1024
-            logger.info(f"Dashboard Size: {size_kb:.2f} KB")
-            device_count = len(dashboard.splitlines())
-            await status_msg.edit_text(f"🧠 Analyzing {device_count} devices... (This takes a moment ⏳)")
-            
-            # 2. Ask AI
-            prompt = (
-                "You are a Home Security Analyst.\n"
-                "Analyze the provided list of devices.\n"
-                "Identify items that are UNSECURED (Unlocked, Open).\n"
-                "Ignore 'locked', 'closed', 'off', 'unavailable', or '2' (Mercedes generic code).\n"
-                "Return valid JSON: {'unsecured': [{'name': '...', 'entity_id': '...'}]}.\n"
-                "If safe, return {'unsecured': []}."
-            )
-            
-            # This call uses Ollama and can be slow
-            ai_resp = await ask_llm(dashboard, system_prompt=prompt)
-            logger.info(f"AI Response: {ai_resp[:100]}...")
-            
-            try:
-                data = extract_json(ai_resp)
-                unsecured = data.get("unsecured", [])
-            except Exception as e:
-                logger.error(f"JSON Parse Error: {e} | Resp: {ai_resp}")
-                await status_msg.edit_text(f"⚠️ AI JSON Error: {e}\nRaw: {ai_resp[:50]}...")
-                unsecured = []
+            unsecured, unknown = security.evaluate(states)
+            lines = []
 
-            # 3. Act
+            # 2. Secure everything at once, then wait for HA to confirm
             if unsecured:
-                names = ", ".join([u["name"] for u in unsecured])
-                await status_msg.edit_text(f"⚠️ **Security Alert**: {names} are UNSECURED!\n🔒 Securing...")
-                
-                for item in unsecured:
-                    eid = item.get("entity_id", "")
-                    if "cover" in eid:
-                        await hass.call_action("cover", "close_cover", eid)
-                    else:
-                        await hass.call_action("lock", "lock", eid)
-                
-                await asyncio.sleep(2)
-                await status_msg.edit_text(f"🔒 Secured {names}.\n😴 Sleeping...")
+                await status_msg.edit_text(f"⚠️ Security Alert: {security.describe(unsecured)}\n🔒 Securing...")
+                secured, failed = await security.secure(unsecured)
+                manual = [f for f in unsecured if not f.action]
+                if secured:
+                    lines.append(f"🔒 Secured: {', '.join(f.name for f in secured)}")
+                if failed:
+                    lines.append(f"⚠️ Did not confirm: {', '.join(f.name for f in failed)}")
+                if manual:
+                    lines.append(f"👀 Check manually: {security.describe(manual)}")
             else:
-                await status_msg.edit_text("✅ Perimeter Secure.\n😴 Sleeping...")
+                secured, failed, manual = [], [], []
+                lines.append("✅ Perimeter Secure.")
+            if unknown:
+                lines.append(f"❔ No reading: {security.describe(unknown)}")
+
+            # 3. Optional natural-language summary
+            if SLEEP_AI_SUMMARY and (failed or manual):
+                summary = await complete(
+                    "\n".join(lines),
+                    system_prompt="Summarize this night-time security report for the family in one or two friendly sentences.",
+                    priority=PRIORITY_COMMAND,
+                )
+                if summary:
+                    lines.append(f"\n{summary}")
+
+            lines.append("😴 Sleeping...")
+            await status_msg.edit_text("\n".join(lines))
 
     except Exception as e:
          logger.error(f"Sleep Error: {e}")
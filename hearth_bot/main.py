@@ -1,9 +1,13 @@
+import time
+BOOT_TIME = time.perf_counter()
+
 import os
 import logging
 import asyncio
+from contextlib import contextmanager
 from aiogram import Bot, Dispatcher
 from dotenv import load_dotenv
-from database import init_db
+from database import init_db, close_db
 from handlers import onboarding, chat, commands
 from aiogram.types import BotCommand
 
@@ -11,35 +15,68 @@ from aiogram.types import BotCommand
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+# Self-hosted Bot API server (or the benchmark's fake one), e.g. http://localhost:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+@contextmanager
+def phase(name: str):
+    """Log how long a startup phase took (track boot regressions)."""
+    started = time.perf_counter()
+    yield
+    logging.info(f"⏱️ Startup: {name} {time.perf_counter() - started:.2f}s")
+
+def create_bot() -> Bot:
+    if TELEGRAM_API_URL:
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+        return Bot(token=TOKEN, session=session)
+    return Bot(token=TOKEN)
+
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    dp = Dispatcher()
+    from handlers import onboarding, chat, commands, callbacks
+    # Register Routers
+    dp.include_router(onboarding.router)
+    dp.include_router(commands.router)
+    dp.include_router(callbacks.router)
+    dp.include_router(chat.router)
+
+    # Global Injection in handlers (Hack for simple V1)
+    chat.bot = bot
+    return dp
 
 # Logic
 async def main():
     logging.basicConfig(level=logging.INFO)
+    logging.info(f"⏱️ Startup: imports {time.perf_counter() - BOOT_TIME:.2f}s")
     
     # 1. Database
-    await init_db()
-    from database import approve_user
-    if ADMIN_ID > 0:
-        await approve_user(ADMIN_ID)
+    with phase("database"):
+        await init_db()
+        from database import approve_user
+        if ADMIN_ID > 0:
+            await approve_user(ADMIN_ID)
     
-    # 2. Init Memory (Downloads Embedding Model if needed)
+    # 1b. Home Assistant Client (shared connection pool)
+    with phase("home assistant"):
+        from services import hass
+        await hass.client.start()
+        from services.state_store import store
+        await store.start(hass.client)
+    
+    # 2. Memory: model + Chroma load in the background; tools wait on readiness
     from services.memory import memory
-    logging.info("Memory Service Ready.")
+    memory.start()
+
+    # 2b. LLM provider health probes (only when a backup provider is configured)
+    from services.providers import providers
+    providers.start()
 
     # 3. Bot Setup
-    bot = Bot(token=TOKEN)
-    dp = Dispatcher()
-    
-    from handlers import onboarding, chat, commands, callbacks
-# ...
-    # 3. Register Routers
-    dp.include_router(onboarding.router)
-    dp.include_router(commands.router)
-    dp.include_router(callbacks.router)
-    dp.include_router(chat.router)
-    
-    # 4. Global Injection in handlers (Hack for simple V1)
-    chat.bot = bot 
+    with phase("bot setup"):
+        bot = create_bot()
+        dp = create_dispatcher(bot)
     
     # 5. Set Bot Menu Commands
     await bot.set_my_commands([
@@ -50,8 +87,25 @@ async def main():
         BotCommand(command="permit", description="Approve User (Admin) 🛡️"),
     ])
     
+    # 6. HTTP API for the Home Assistant conversation agent (same event loop)
+    import api
+    with phase("api"):
+        api_runner = await api.start()
+
+    logging.info(f"⏱️ Startup: ready to poll after {time.perf_counter() - BOOT_TIME:.2f}s")
     logging.info("Hearth Bot V2 Starting...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Persist any facts still waiting in the write-behind buffer
+        await api.stop(api_runner)
+        memory.flush()
+        await providers.stop()
+        await store.stop()
+        await hass.client.close()
+        await close_db()
+        from services import executor
+        executor.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
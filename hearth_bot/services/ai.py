@@ -1,72 +1,261 @@
 import aiohttp
+import asyncio
 import os
+import json
+import time
 import logging
 import google.generativeai as genai
-from services.tools import TOOLS_SCHEMA, execute_tool
+from services.tools import TOOLS_SCHEMA, execute_tool, request_context
+from services.cache import TTLCache
+from services.response_cache import responses, tool_log, record_tool
+from services.scheduler import scheduler, PRIORITY_CHAT, PRIORITY_BACKGROUND
+from services.providers import providers
+from services.metrics import (TOOL_SECONDS, LLM_CALL_SECONDS, LLM_TOKENS,
+                              OLLAMA_PROMPT_EVAL_SECONDS, OLLAMA_EVAL_SECONDS)
 
 logger = logging.getLogger(__name__)
 
 # Config
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://host.docker.internal:11434/api/chat")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
-AI_PROVIDER = os.getenv("AI_PROVIDER", "ollama")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+OLLAMA_TIMEOUT = 120
+# Agent Loop
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+MAX_TOOL_ITERATIONS = int(os.getenv("MAX_TOOL_ITERATIONS", "4"))
+# Keep the model (and its prompt KV cache) resident between turns
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
-if AI_PROVIDER == "gemini" and GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Gemini Provider Tuning
+# 2.0-flash-001 (Stable) to hopefully avoid the 20/day limit of 2.5
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.0-flash-001")
+GEMINI_MAX_CHATS = int(os.getenv("GEMINI_MAX_CHATS", "64"))
+GEMINI_CHAT_TTL = float(os.getenv("GEMINI_CHAT_TTL", "3600"))
+GEMINI_MAX_HISTORY = 20
 
-async def ask_llm(user_text: str, system_prompt: str = None, chat_history: list = None) -> str:
-    if AI_PROVIDER == "gemini":
-        return await ask_gemini(user_text, system_prompt)
-    else:
-        return await ask_ollama(user_text, system_prompt)
+def _to_gemini_schema(schema: dict) -> dict:
+    """Translate a JSON-schema fragment (TOOLS_SCHEMA style) to Gemini's OpenAPI subset."""
+    out = {}
+    for key, value in schema.items():
+        if key == "type":
+            out["type"] = value.upper()
+        elif key == "properties":
+            out["properties"] = {name: _to_gemini_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            out["items"] = _to_gemini_schema(value)
+        elif key in ("description", "required", "enum"):
+            out[key] = value
+    return out
 
-async def ask_gemini(user_text: str, system_prompt: str = None) -> str:
-    try:
-        # Debug Mode: Try minimal text generation first to prove connectivity
-        # switching to 2.0-flash-001 (Stable) to hopefully avoid the 20/day limit of 2.5
-        model_name = "models/gemini-2.0-flash-001" 
-        
-        # Tools: Updated for arguments
-        tool_config = {
+class GeminiProvider:
+    """
+    Built once: function declarations, the GenerativeModel, and an LRU of
+    per-conversation chat sessions. Only the chat turn itself happens per message.
+    """
+    def __init__(self, tools_schema: list, model_name: str = GEMINI_MODEL):
+        self.model_name = model_name
+        self.tool_config = {
             "function_declarations": [
                 {
-                    "name": "get_calendar_events",
-                    "description": "Fetch upcoming events from the family calendar.",
-                    "parameters": {
-                        "type": "OBJECT",
-                        "properties": {
-                            "start_date": {"type": "STRING", "description": "YYYY-MM-DD"},
-                            "end_date": {"type": "STRING", "description": "YYYY-MM-DD"}
-                        },
-                        "required": ["start_date", "end_date"]
-                    }
-                },
-                {
-                    "name": "check_home",
-                    "description": "Check the status of devices in the house (lights, sensors, switches, printers, locks, vehicles, etc).",
-                    "parameters": {
-                        "type": "OBJECT", "properties": {}
-                    }
-                },
-                {
-                    "name": "control_device",
-                    "description": "Turn a device on/off or call a service.",
-                    "parameters": {
-                        "type": "OBJECT",
-                        "properties": {
-                            "domain": {"type": "STRING", "description": "e.g. light"},
-                            "service": {"type": "STRING", "description": "e.g. turn_on"},
-                            "entity_id": {"type": "STRING", "description": "e.g. light.kitchen"}
-                        },
-                        "required": ["domain", "service", "entity_id"]
-                    }
+                    "name": tool["function"]["name"],
+                    "description": tool["function"].get("description", ""),
+                    "parameters": _to_gemini_schema(tool["function"].get("parameters", {"type": "object", "properties": {}})),
                 }
+                for tool in tools_schema
             ]
         }
+        self._model = None
+        self._chats = TTLCache(maxsize=GEMINI_MAX_CHATS, ttl=GEMINI_CHAT_TTL)
+
+    @property
+    def model(self):
+        if self._model is None:
+            if GEMINI_API_KEY:
+                genai.configure(api_key=GEMINI_API_KEY)
+            self._model = genai.GenerativeModel(
+                model_name=self.model_name,
+                # system_instruction=system_prompt, # Disabled to avoid SDK ambiguity
+                tools=[self.tool_config]
+            )
+        return self._model
+
+    def get_chat(self, conversation_id: str = None, system_prompt: str = None):
+        """
+        Returns (chat, is_new). A conversation keeps its session until the
+        system prompt changes (e.g. date rollover) or it is evicted.
+        """
+        prompt_key = hash(system_prompt)
+        if conversation_id:
+            entry = self._chats.get(conversation_id)
+            if entry and entry[0] == prompt_key:
+                chat = entry[1]
+                # Keep the opening (system) exchange plus the most recent turns
+                if len(chat.history) > GEMINI_MAX_HISTORY + 2:
+                    chat.history = chat.history[:2] + chat.history[-GEMINI_MAX_HISTORY:]
+                return chat, False
+
+        chat = self.model.start_chat(enable_automatic_function_calling=False)
+        if conversation_id:
+            self._chats.set(conversation_id, (prompt_key, chat))
+        return chat, True
+
+    def drop_chat(self, conversation_id: str):
+        self._chats.pop(conversation_id)
+
+gemini = GeminiProvider(TOOLS_SCHEMA)
+
+def _tool_name(tool_call) -> str:
+    if isinstance(tool_call, dict):
+        return tool_call.get("function", {}).get("name", "unknown")
+    return "unknown"
+
+async def _run_tool(tool_call):
+    """One tool call, bounded by TOOL_TIMEOUT. Failures become text for the model."""
+    name = _tool_name(tool_call)
+    if refusal := providers.guard_tool(name):
+        return refusal
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        result = await asyncio.wait_for(execute_tool(tool_call), TOOL_TIMEOUT)
+        record_tool(tool_call, result)
+        return result
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.warning(f"Tool {name} timed out after {TOOL_TIMEOUT:g}s")
+        record_tool(tool_call, None, failed=True)
+        return f"Error: {name} timed out."
+    except Exception as e:
+        outcome = "error"
+        logger.error(f"Tool {name} failed: {e}")
+        record_tool(tool_call, None, failed=True)
+        return f"Error: {name} failed ({e})."
+    finally:
+        TOOL_SECONDS.observe(time.perf_counter() - started, tool=name, outcome=outcome)
+
+async def run_tools(tool_calls: list) -> list:
+    """Run independent tool calls concurrently; results keep the calls' order."""
+    return await asyncio.gather(*[_run_tool(t) for t in tool_calls])
 
-        # Inject System Prompt + Date here to ensure it is seen
-        if system_prompt:
+def _permission_request(results: list):
+    for result in results:
+        if isinstance(result, str) and result.startswith("__REQ_PERM__"):
+            return result
+    return None
+
+async def ask_llm(user_text: str, system_prompt: str = None, chat_history: list = None, stream=None,
+                  conversation_id: str = None, priority: int = PRIORITY_CHAT, private: bool = False,
+                  status=None) -> str:
+    """
+    Ask the best available provider (see services/providers.py); `private`
+    requests stay on the local model. If `stream` is given (see services/streaming.py),
+    text is pushed to it as it is generated; the full answer is still returned.
+    Without a stream, `status` (a StatusMessage) shows the queue position instead.
+    Repeated self-contained questions are answered from the response cache;
+    everything else waits its turn in the LLM scheduler.
+    Raises scheduler.Superseded if the same user sends a newer chat message first.
+    """
+    user = request_context.get().get("user")
+    key = responses.key(user_text, system_prompt, scope=conversation_id or user, private=private)
+    if key:
+        cached = await responses.get(key, _run_tool)
+        if cached is not None:
+            return cached
+
+    token = tool_log.set([])
+    try:
+        def attempt(provider: str, attempt_stream):
+            if provider == "gemini":
+                return ask_gemini(user_text, system_prompt, stream=attempt_stream, conversation_id=conversation_id,
+                                  chat_history=chat_history)
+            return ask_ollama(user_text, system_prompt, stream=attempt_stream, chat_history=chat_history)
+
+        reply = await scheduler.run(
+            lambda: providers.ask(attempt, stream=stream, private=private), user=user, priority=priority,
+            stream=stream or status
+        )
+        calls = tool_log.get()
+    finally:
+        tool_log.reset(token)
+
+    if key and reply and not is_error_reply(reply) and reply != "Startled silence." \
+            and not reply.startswith("__REQ_PERM__"):
+        responses.put(key, reply, calls)
+    return reply
+
+def is_error_reply(text: str) -> bool:
+    """True for the canned failure strings the providers return instead of raising."""
+    return text in ("Brain Error.", "Brain Offline.") or text.startswith("Gemini Error:")
+
+async def complete(prompt: str, system_prompt: str = None, priority: int = PRIORITY_BACKGROUND) -> str:
+    """Plain completion without tools (summaries, classification). Queued behind chat by default."""
+    reply = await scheduler.run(
+        lambda: providers.ask(lambda provider, _: _complete(provider, prompt, system_prompt), hedge=False),
+        priority=priority,
+    )
+    return "" if is_error_reply(reply) else reply
+
+async def _complete(provider: str, prompt: str, system_prompt: str = None) -> str:
+    if provider == "gemini":
+        try:
+            text = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+            with LLM_CALL_SECONDS.time(provider="gemini"):
+                response = await gemini.model.generate_content_async(text)
+            _record_gemini_usage(response)
+            return response.text
+        except Exception as e:
+            logger.error(f"Gemini Error: {e}")
+            return f"Gemini Error: {e}"
+
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    async with aiohttp.ClientSession() as session:
+        response = await _ollama_call(session, messages)
+    return response.get("content", "")
+
+def _format_history(chat_history: list) -> str:
+    lines = []
+    for turn in chat_history:
+        speaker = {"user": "User", "assistant": "Hearth"}.get(turn["role"], "Note")
+        lines.append(f"{speaker}: {turn['content']}")
+    return "\n".join(lines)
+
+async def _gemini_send(chat, content, stream=None):
+    """Send one turn. When streaming, push text parts as they arrive."""
+    with LLM_CALL_SECONDS.time(provider="gemini"):
+        if not stream:
+            response = await chat.send_message_async(content)
+        else:
+            response = await chat.send_message_async(content, stream=True)
+            async for chunk in response:
+                for part in chunk.parts:
+                    if part.function_call:
+                        await stream.reset()
+                    elif part.text:
+                        await stream.push(part.text)
+    _record_gemini_usage(response)
+    return response
+
+def _record_gemini_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, provider="gemini", kind="prompt")
+        LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, provider="gemini", kind="generated")
+
+async def ask_gemini(user_text: str, system_prompt: str = None, stream=None, conversation_id: str = None,
+                     chat_history: list = None) -> str:
+    try:
+        chat, is_new = gemini.get_chat(conversation_id, system_prompt)
+        # A live session already holds the history; a fresh one gets it replayed as text
+        if is_new and chat_history:
+            user_text = f"Conversation so far:\n{_format_history(chat_history)}\n\n{user_text}"
+
+        # Inject System Prompt + Date on the first turn of a session to ensure it is seen
+        if not is_new:
+             full_prompt = f"User Query: {user_text}"
+        elif system_prompt:
              full_prompt = f"{system_prompt}\n\nUser Query: {user_text}"
         else:
              from datetime import datetime
@@ -74,92 +263,172 @@ async def ask_gemini(user_text: str, system_prompt: str = None) -> str:
              full_prompt = f"System: Today is {now_str}.\n\nUser Query: {user_text}"
         
         logger.info(f"📤 Sending to Gemini: {full_prompt[:100]}...")
-
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            # system_instruction=system_prompt, # Disabled to avoid SDK ambiguity
-            tools=[tool_config] 
-        )
         
-        chat = model.start_chat(enable_automatic_function_calling=False)
+        response = await _gemini_send(chat, full_prompt, stream)
         
-        response = await chat.send_message_async(full_prompt)
-        
-        # Handle Function Call
-        if response.parts:
-            for part in response.parts:
-                if fn := part.function_call:
-                    logger.info(f"Gemini requested tool: {fn.name} with args {fn.args}")
-                    
-                    # Generic Argument Extraction
-                    args_dict = {}
-                    if fn.args:
-                        # Convert Proto Map to dict
-                        for key in fn.args:
-                            args_dict[key] = fn.args[key]
-                    
-                    tool_call_obj = {
-                        "function": {
-                            "name": fn.name,
-                            "arguments": args_dict
-                        }
-                    }
-                    
-                    result = await execute_tool(tool_call_obj)
-                    
-                    follow_up = f"Tool Result for {fn.name}:\n{result}\n\nPlease summarize this for the user."
-                    response = await chat.send_message_async(follow_up)
-                    return response.text
-
-        return response.text
+        # Agent Loop: run requested tools, feed results back, repeat
+        for _ in range(MAX_TOOL_ITERATIONS):
+            calls = [part.function_call for part in response.parts if part.function_call]
+            if not calls:
+                break
+
+            tool_calls = []
+            for fn in calls:
+                logger.info(f"Gemini requested tool: {fn.name} with args {fn.args}")
+                # Generic Argument Extraction (Proto Map -> dict)
+                args_dict = {key: fn.args[key] for key in fn.args} if fn.args else {}
+                tool_calls.append({"function": {"name": fn.name, "arguments": args_dict}})
+
+            results = await run_tools(tool_calls)
+            if perm := _permission_request(results):
+                return perm
+
+            follow_up = "\n\n".join(
+                f"Tool Result for {fn.name}:\n{result}" for fn, result in zip(calls, results)
+            ) + "\n\nPlease summarize this for the user."
+            response = await _gemini_send(chat, follow_up, stream)
+
+        try:
+            return response.text
+        except ValueError:
+            # Iteration cap reached while the model still wanted a tool
+            return "Startled silence."
     except Exception as e:
         logger.error(f"Gemini Error: {e}")
+        # A failed turn can leave the session mid-function-call; start fresh next time
+        if conversation_id:
+            gemini.drop_chat(conversation_id)
         return f"Gemini Error: {e}"
+    except asyncio.CancelledError:
+        # Superseded mid-turn: same problem as a failure
+        if conversation_id:
+            gemini.drop_chat(conversation_id)
+        raise
 
 # --- OLLAMA IMPLEMENTATION ---
-async def ask_ollama(user_text: str, system_prompt: str = None) -> str:
-    # ... (Same as before) ...
+async def ask_ollama(user_text: str, system_prompt: str = None, stream=None, chat_history: list = None) -> str:
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
+    if chat_history:
+        messages.extend(chat_history)
     messages.append({"role": "user", "content": user_text})
 
     async with aiohttp.ClientSession() as session:
-        response = await _ollama_call(session, messages, tools=TOOLS_SCHEMA)
-        
-        if response.get("tool_calls"):
-            tool_calls = response["tool_calls"]
-            messages.append(response) 
-            for tool in tool_calls:
-                result = await execute_tool(tool)
-                
-                # Intercept Permission Request
-                if isinstance(result, str) and result.startswith("__REQ_PERM__"):
-                    return result
-                
+        response = await _ollama_call(session, messages, tools=TOOLS_SCHEMA, stream=stream)
+        if not response.get("tool_calls"):
+            return response.get("content", "I am confused.")
+
+        # Agent Loop: tool -> LLM -> tool ... up to MAX_TOOL_ITERATIONS rounds
+        for _ in range(MAX_TOOL_ITERATIONS):
+            tool_calls = response.get("tool_calls")
+            if not tool_calls:
+                break
+            messages.append(response)
+            results = await run_tools(tool_calls)
+
+            # Intercept Permission Request
+            if perm := _permission_request(results):
+                return perm
+
+            for tool, result in zip(tool_calls, results):
                 messages.append({
                     "role": "tool",
                     "content": str(result),
+                    "tool_name": _tool_name(tool),
                 })
-            final = await _ollama_call(session, messages)
-            return final.get("content", "Startled silence.")
+            response = await _ollama_call(session, messages, tools=TOOLS_SCHEMA, stream=stream)
 
-        return response.get("content", "I am confused.")
+        if response.get("tool_calls"):
+            # Cap reached: force a plain answer from what we have
+            response = await _ollama_call(session, messages, stream=stream)
+        return response.get("content") or "Startled silence."
 
-async def _ollama_call(session, messages, tools=None):
+def _ollama_payload(messages, tools=None, stream=False) -> dict:
+    # The system prompt leads every request unchanged (see services/prompts.py),
+    # so with keep_alive Ollama only evaluates the new tail of the conversation.
     payload = {
         "model": OLLAMA_MODEL,
         "messages": messages,
-        "stream": False
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
     }
     if tools:
         payload["tools"] = tools
+    return payload
+
+def _record_ollama_timings(data: dict):
+    """Ollama's own accounting from a final response: durations in ns, counts in tokens."""
+    if data.get("prompt_eval_duration"):
+        OLLAMA_PROMPT_EVAL_SECONDS.observe(data["prompt_eval_duration"] / 1e9)
+    if data.get("eval_duration"):
+        OLLAMA_EVAL_SECONDS.observe(data["eval_duration"] / 1e9)
+    # prompt_eval_count only covers tokens not served from the KV cache
+    LLM_TOKENS.inc(data.get("prompt_eval_count", 0), provider="ollama", kind="prompt")
+    LLM_TOKENS.inc(data.get("eval_count", 0), provider="ollama", kind="generated")
 
+async def _ollama_call(session, messages, tools=None, stream=None):
+    with LLM_CALL_SECONDS.time(provider="ollama"):
+        if stream:
+            return await _ollama_stream(session, messages, tools, stream)
+
+        payload = _ollama_payload(messages, tools, stream=False)
+
+        try:
+            async with session.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    _record_ollama_timings(data)
+                    return data.get("message", {})
+                return {"content": "Brain Error."}
+        except Exception as e:
+            logger.error(f"Ollama Error: {e}")
+            return {"content": "Brain Offline."}
+
+async def _ollama_stream(session, messages, tools, stream):
+    """
+    Consume Ollama's NDJSON stream, pushing content deltas to `stream`.
+    Returns the assembled message, including any tool_calls seen mid-stream.
+    A stream that breaks off before its `done` chunk is a failure, whatever
+    text already arrived.
+    """
+    payload = _ollama_payload(messages, tools, stream=True)
+
+    content = ""
+    tool_calls = []
+    done = False
+    # No total cap: a long answer is fine as long as tokens keep flowing
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=OLLAMA_TIMEOUT)
     try:
-        async with session.post(OLLAMA_URL, json=payload, timeout=120) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                return data.get("message", {})
-            return {"content": "Brain Error."}
-    except:
+        async with session.post(OLLAMA_URL, json=payload, timeout=timeout) as resp:
+            if resp.status != 200:
+                return {"content": "Brain Error."}
+            async for line in resp.content:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                message = chunk.get("message", {})
+                if message.get("tool_calls"):
+                    tool_calls.extend(message["tool_calls"])
+                    # Any text so far was preamble to a tool turn, not the answer
+                    if content:
+                        content = ""
+                    await stream.reset()
+                if delta := message.get("content"):
+                    content += delta
+                    if not tool_calls:
+                        await stream.push(delta)
+                if chunk.get("done"):
+                    _record_ollama_timings(chunk)
+                    done = True
+                    break
+    except Exception as e:
+        logger.error(f"Ollama Stream Error: {e}")
+    if not done:
         return {"content": "Brain Offline."}
+
+    result = {"role": "assistant", "content": content}
+    if tool_calls:
+        result["tool_calls"] = tool_calls
+    return result
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import logging
+from collections import OrderedDict, deque
+import database
+
+logger = logging.getLogger(__name__)
+
+# Budget for replayed history per prompt (approximate tokens, not messages)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1024"))
+# Chats kept hot in memory; the rest are reloaded from SQLite on demand
+MAX_CACHED_CHATS = int(os.getenv("MAX_CACHED_CHATS", "200"))
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a family's chat with their home assistant.\n"
+    "Merge the previous summary and the new messages into one short paragraph (max 80 words).\n"
+    "Keep names, decisions, open questions and facts the assistant may need later. Drop small talk."
+)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token) plus per-message overhead."""
+    return len(text) // 4 + 4
+
+class Conversation:
+    def __init__(self, chat_id: str, summary: str = None, upto_id: int = 0):
+        self.chat_id = chat_id
+        self.summary = summary
+        self.upto_id = upto_id
+        self.turns = deque()  # (id, role, content, tokens), oldest first
+        self.tokens = 0
+        self.summarizing = False
+
+class ConversationStore:
+    """
+    Per-chat history persisted in SQLite.
+    Replayed history is capped by a token budget; turns that fall out of the
+    window are folded into a rolling summary by a background task.
+    """
+    def __init__(self, budget: int = HISTORY_TOKEN_BUDGET, max_chats: int = MAX_CACHED_CHATS):
+        self.budget = budget
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self._tasks = set()
+
+    async def _get(self, chat_id: str) -> Conversation:
+        conv = self._chats.get(chat_id)
+        if conv is None:
+            summary, upto_id = await database.get_summary(chat_id)
+            conv = Conversation(chat_id, summary, upto_id)
+            for row in await database.get_turns(chat_id, upto_id):
+                conv.turns.append(tuple(row))
+                conv.tokens += row[3]
+            self._chats[chat_id] = conv
+            self._maybe_summarize(conv)
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return conv
+
+    async def history(self, chat_id: str) -> list:
+        """Messages to replay before the new user turn, newest turns within budget."""
+        conv = await self._get(chat_id)
+        messages = []
+        used = 0
+        for _, role, content, tokens in reversed(conv.turns):
+            if used + tokens > self.budget:
+                break
+            messages.append({"role": role, "content": content})
+            used += tokens
+        messages.reverse()
+        # Start the window on a user turn
+        if messages and messages[0]["role"] == "assistant":
+            messages.pop(0)
+        if conv.summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {conv.summary}"})
+        return messages
+
+    async def append(self, chat_id: str, user_text: str, reply: str):
+        conv = await self._get(chat_id)
+        for role, content in (("user", user_text), ("assistant", reply)):
+            tokens = estimate_tokens(content)
+            turn_id = await database.add_turn(chat_id, role, content, tokens)
+            conv.turns.append((turn_id, role, content, tokens))
+            conv.tokens += tokens
+        self._maybe_summarize(conv)
+
+    def _maybe_summarize(self, conv: Conversation):
+        if conv.tokens <= self.budget or conv.summarizing:
+            return
+        conv.summarizing = True
+        task = asyncio.create_task(self._summarize(conv))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, conv: Conversation):
+        """Fold the oldest turns into the summary until the window fits in half the budget."""
+        try:
+            evicted = []
+            remaining = conv.tokens
+            for turn in conv.turns:
+                if remaining <= self.budget // 2:
+                    break
+                evicted.append(turn)
+                remaining -= turn[3]
+            if not evicted:
+                return
+
+            transcript = "\n".join(f"{role}: {content}" for _, role, content, _ in evicted)
+            text = f"Previous summary: {conv.summary or '(none)'}\n\nNew messages:\n{transcript}"
+            from services.ai import complete, is_error_reply
+            summary = await complete(text, system_prompt=SUMMARY_PROMPT)
+            if not summary or is_error_reply(summary):
+                return
+
+            upto_id = evicted[-1][0]
+            await database.set_summary(conv.chat_id, summary, upto_id)
+            conv.summary = summary
+            conv.upto_id = upto_id
+            while conv.turns and conv.turns[0][0] <= upto_id:
+                conv.tokens -= conv.turns.popleft()[3]
+            logger.info(f"💬 Summarized {len(evicted)} turns for chat {conv.chat_id}")
+        except Exception as e:
+            logger.error(f"Summarize Error: {e}")
+        finally:
+            conv.summarizing = False
+
+# Singleton Instance
+conversations = ConversationStore()
@@ -0,0 +1,130 @@
+from chromadb.api.types import EmbeddingFunction, Documents, Embeddings
+from array import array
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+# Rows kept on disk; every chat query is embedded, so the table is trimmed least-recently-used first
+EMBED_DB_SIZE = int(os.getenv("EMBED_DB_SIZE", "20000"))
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """
+    Wraps the SentenceTransformer embedder with a content-hash keyed cache:
+    an in-memory LRU in front of a small SQLite table that survives restarts
+    (capped at max_rows, least recently used rows go first).
+    Only texts missing from both are embedded, in a single batch.
+    """
+    def __init__(self, inner, model_name: str, path: str, maxsize: int = EMBED_CACHE_SIZE,
+                 max_rows: int = EMBED_DB_SIZE):
+        self.inner = inner
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB, used REAL)")
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+        if "used" not in columns:
+            # Tables from before the row cap
+            self._db.execute("ALTER TABLE embeddings ADD COLUMN used REAL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self._db.commit()
+        self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    # Present as the wrapped embedder so Chroma's persisted collection config still matches
+    def name(self) -> str:
+        return self.inner.name()
+
+    def get_config(self) -> dict:
+        return self.inner.get_config()
+
+    def is_legacy(self) -> bool:
+        return self.inner.is_legacy()
+
+    def default_space(self):
+        return self.inner.default_space()
+
+    def supported_spaces(self):
+        return self.inner.supported_spaces()
+
+    def validate_config(self, config: dict) -> None:
+        return self.inner.validate_config(config)
+
+    def validate_config_update(self, old_config: dict, new_config: dict) -> None:
+        return self.inner.validate_config_update(old_config, new_config)
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _remember(self, key: str, vector: list):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(text) for text in input]
+        vectors = [None] * len(input)
+        missing = []
+        loaded = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    vectors[i] = self._lru[key]
+                    continue
+                row = self._db.execute("SELECT vector FROM embeddings WHERE hash = ?", (key,)).fetchone()
+                if row:
+                    vectors[i] = array("f", row[0]).tolist()
+                    self._remember(key, vectors[i])
+                    loaded.append(key)
+                else:
+                    missing.append(i)
+            if loaded:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET used = ? WHERE hash = ?", [(now, k) for k in loaded])
+                self._db.commit()
+            self.hits += len(input) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = self.inner([input[i] for i in missing])
+            now = time.time()
+            with self._lock:
+                for i, vector in zip(missing, computed):
+                    vector = [float(x) for x in vector]
+                    vectors[i] = vector
+                    self._remember(keys[i], vector)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (hash, vector, used) VALUES (?, ?, ?)",
+                        (keys[i], array("f", vector).tobytes(), now),
+                    )
+                self._rows += len(missing)
+                # Trim in batches (10% slack) rather than on every insert
+                if self._rows > self.max_rows * 1.1:
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE hash IN "
+                        "(SELECT hash FROM embeddings ORDER BY used LIMIT ?)",
+                        (self._rows - self.max_rows,),
+                    )
+                    self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                self._db.commit()
+        return vectors
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._lru),
+            "rows": self._rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
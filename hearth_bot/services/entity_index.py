@@ -0,0 +1,176 @@
+import re
+import logging
+from collections import defaultdict
+from difflib import SequenceMatcher
+from services.state_store import store
+
+logger = logging.getLogger(__name__)
+
+# Minimum share of the query's trigrams an entity must contain to be listed
+SEARCH_MIN_COVERAGE = 0.6
+# Looser bar for the resolve() shortlist; SequenceMatcher makes the final call
+SHORTLIST_MIN_COVERAGE = 0.3
+
+_FILLER = re.compile(r"^(?:hey\s+|ok\s+|okay\s+|please\s+|can you\s+|could you\s+|would you\s+)+")
+_ARTICLE = re.compile(r"^(?:the|my|our)\s+")
+_PUNCT = re.compile(r"[^\w\s]")
+
+# Nouns people append to device names ("the kitchen *light*")
+DOMAIN_NOUNS = {"light": "light", "switch": "switch", "fan": "fan", "cover": "door", "lock": "lock", "climate": "heating"}
+
+def normalize(text: str) -> str:
+    text = _PUNCT.sub(" ", (text or "").lower())
+    text = " ".join(text.split())
+    return _FILLER.sub("", text)
+
+def trigrams(text: str) -> set:
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _score(target: str, alias: str) -> float:
+    ratio = SequenceMatcher(None, target, alias).ratio()
+    # "garage" -> "Garage Door": every spoken word is in the name
+    if set(target.split()) <= set(alias.split()):
+        return max(ratio, 0.8 + 0.1 * ratio)
+    return ratio
+
+class Entry:
+    __slots__ = ("entity_id", "domain", "name", "area", "device_class", "aliases", "grams")
+
+    def __init__(self, state: dict, area: str = None):
+        attrs = state.get("attributes", {})
+        self.entity_id = state["entity_id"]
+        self.domain, object_id = self.entity_id.split(".", 1)
+        self.name = attrs.get("friendly_name") or object_id
+        self.area = area
+        self.device_class = attrs.get("device_class")
+
+        name = normalize(self.name)
+        self.aliases = {name, object_id.replace("_", " ")}
+        noun = DOMAIN_NOUNS.get(self.domain)
+        if noun and not name.endswith(noun):
+            self.aliases.add(f"{name} {noun}")
+        if area and normalize(area) not in name:
+            self.aliases.add(f"{normalize(area)} {name}")
+
+        # Searchable text: names plus area, device class and domain
+        extra = [normalize(area), normalize(self.device_class), self.domain.replace("_", " ")]
+        self.grams = trigrams(" ".join(sorted(self.aliases) + [e for e in extra if e]))
+
+    def key(self) -> tuple:
+        return (self.name, self.area, self.device_class)
+
+class EntityIndex:
+    """
+    Trigram index over friendly names, areas, device classes and domains.
+    Kept current by a state-store listener; only name/area/class changes
+    touch the index, plain state changes are free.
+    """
+    def __init__(self):
+        self.entries = {}
+        self._grams = defaultdict(set)
+        self._domains = defaultdict(set)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, entity_id: str, old_state: dict, new_state: dict):
+        if new_state is None:
+            self._remove(entity_id)
+            return
+        entry = Entry(new_state, store.area(entity_id))
+        current = self.entries.get(entity_id)
+        if current is not None and current.key() == entry.key():
+            return
+        self._remove(entity_id)
+        self.entries[entity_id] = entry
+        self._domains[entry.domain].add(entity_id)
+        for gram in entry.grams:
+            self._grams[gram].add(entity_id)
+
+    def _remove(self, entity_id: str):
+        entry = self.entries.pop(entity_id, None)
+        if entry is None:
+            return
+        self._domains[entry.domain].discard(entity_id)
+        for gram in entry.grams:
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del self._grams[gram]
+
+    def _coverage(self, query: str, allowed: set = None) -> dict:
+        """entity_id -> share of the query's trigrams it contains."""
+        grams = trigrams(query)
+        if not grams:
+            return {}
+        hits = defaultdict(int)
+        for gram in grams:
+            for eid in self._grams.get(gram, ()):
+                if allowed is None or eid in allowed:
+                    hits[eid] += 1
+        return {eid: count / len(grams) for eid, count in hits.items()}
+
+    def _in_domains(self, domains) -> set:
+        ids = set()
+        for domain in domains:
+            ids |= self._domains.get(domain, set())
+        return ids
+
+    def search(self, query: str = None, area: str = None, domain: str = None, domains=None, limit: int = 50) -> list:
+        """Entries matching every given filter, best match first."""
+        allowed = self._in_domains([domain] if domain else domains) if (domain or domains) else None
+        if area:
+            area = normalize(area)
+            in_area = {
+                eid for eid, e in self.entries.items()
+                if e.area and (normalize(e.area) == area or _score(area, normalize(e.area)) >= 0.8)
+            }
+            allowed = in_area if allowed is None else allowed & in_area
+        if query and normalize(query):
+            scored = [
+                (score, eid) for eid, score in self._coverage(normalize(query), allowed).items()
+                if score >= SEARCH_MIN_COVERAGE
+            ]
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            ids = [eid for _, eid in scored]
+        else:
+            ids = sorted(allowed if allowed is not None else self.entries)
+        return [self.entries[eid] for eid in ids[:limit]]
+
+    def resolve(self, target: str, domains, accept=None, min_score: float = 0.82, min_margin: float = 0.08,
+                prefer: set = None):
+        """
+        The single entity a spoken name refers to, or None when no entity is a
+        clear winner. accept(entry) can veto candidates (e.g. by device class).
+        A near-tie is settled if exactly one contender is in a `prefer` domain
+        (a garage cover over its own door sensor).
+        """
+        target = _ARTICLE.sub("", normalize(target))
+        shortlist = self._coverage(target, self._in_domains(domains))
+        scored = []
+        for eid, coverage in shortlist.items():
+            entry = self.entries[eid]
+            if coverage < SHORTLIST_MIN_COVERAGE or (accept and not accept(entry)):
+                continue
+            scored.append((max(_score(target, alias) for alias in entry.aliases), entry))
+        if not scored:
+            return None
+        scored.sort(key=lambda item: item[0], reverse=True)
+        best_score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best_score < min_score:
+            return None
+        if best_score - runner_up < min_margin:
+            contenders = [entry for score, entry in scored if best_score - score < min_margin]
+            preferred = [entry for entry in contenders if entry.domain in (prefer or ())]
+            return preferred[0] if len(preferred) == 1 else None
+        return best
+
+# Singleton Instance
+index = EntityIndex()
+store.add_listener(index.update)
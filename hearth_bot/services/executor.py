@@ -0,0 +1,93 @@
+import asyncio
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Network-bound work (web search, sync HTTP clients) can overlap freely.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+# CPU-bound work (embeddings, Chroma) competes for the Pi's cores; keep it narrow.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "1"))
+# Jobs allowed to wait per pool before callers are held back on the event loop
+MAX_QUEUE = int(os.getenv("EXECUTOR_MAX_QUEUE", "32"))
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking calls, with queue-depth accounting.
+    Submissions beyond workers + MAX_QUEUE wait (asynchronously) for a slot.
+    """
+    def __init__(self, name: str, workers: int, max_queue: int = MAX_QUEUE):
+        self.name = name
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hearth-{name}")
+        self._slots = asyncio.Semaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.peak_queue = 0
+
+    async def run(self, fn, *args, **kwargs):
+        async with self._slots:
+            with self._lock:
+                self.queued += 1
+                self.peak_queue = max(self.peak_queue, self.queued)
+
+            state = {"started": False, "abandoned": False}
+
+            def job():
+                with self._lock:
+                    if state["abandoned"]:
+                        return None
+                    state["started"] = True
+                    self.queued -= 1
+                    self.active += 1
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    with self._lock:
+                        self.active -= 1
+                        self.completed += 1
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._pool, job)
+            finally:
+                # Caller cancelled (e.g. wait_for timeout) before a worker picked the job up
+                with self._lock:
+                    if not state["started"]:
+                        state["abandoned"] = True
+                        self.queued -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "peak_queue": self.peak_queue,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+io_pool = BoundedExecutor("io", IO_WORKERS)
+cpu_pool = BoundedExecutor("cpu", CPU_WORKERS)
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking network call off the event loop."""
+    return await io_pool.run(fn, *args, **kwargs)
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a blocking CPU-heavy call (embeddings, vector DB) off the event loop."""
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+def stats() -> dict:
+    return {"io": io_pool.stats(), "cpu": cpu_pool.stats()}
+
+def shutdown():
+    io_pool.shutdown()
+    cpu_pool.shutdown()
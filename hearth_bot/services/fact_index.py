@@ -0,0 +1,128 @@
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Question words and filler that would match nearly every fact
+STOPWORDS = frozenset("""
+    the and for are but not you your yours our ours his her hers its they them their this that these those
+    what whats when where which who whom whose why how was were been being have has had does did doing
+    can could would should will shall may might must about into from with without over under again then
+    than there here all any some such only own same very just now also too tell know remember recall
+    please me my mine myself we us him she he it is am be do of to in on at by or as if so up out
+""".split())
+# A keyword-only hit must contain at least this share of the query's terms
+KEYWORD_MIN_MATCH = 0.5
+
+def query_terms(text: str) -> list:
+    """Distinct content words of a query: no stopwords, no 1-2 letter words (short codes with digits stay)."""
+    terms = []
+    for token in _TOKEN.findall((text or "").lower()):
+        if token in STOPWORDS or (len(token) < 3 and not any(c.isdigit() for c in token)):
+            continue
+        if token not in terms:
+            terms.append(token)
+    return terms
+
+def to_epoch(timestamp: str) -> float:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+class FactIndex:
+    """
+    SQLite FTS5 mirror of the hearth_facts collection, for BM25 keyword search.
+    Catches exact tokens (codes, plates, names) that embeddings blur together.
+    Thread-safe; called from the CPU pool alongside Chroma.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
+                fact_id UNINDEXED,
+                document,
+                user UNINDEXED,
+                source UNINDEXED,
+                ts UNINDEXED,
+                tokenize = 'unicode61'
+            )
+        """)
+        self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM facts_fts").fetchone()[0]
+
+    def upsert(self, items: list):
+        """items: iterable of (fact_id, document, meta)."""
+        rows = [
+            (fact_id, doc, str((meta or {}).get("user", "")), str((meta or {}).get("source", "")),
+             to_epoch((meta or {}).get("timestamp")))
+            for fact_id, doc, meta in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM facts_fts WHERE fact_id = ?", [(r[0],) for r in rows])
+            self._db.executemany(
+                "INSERT INTO facts_fts (fact_id, document, user, source, ts) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM facts_fts WHERE fact_id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def rebuild(self, items: list):
+        with self._lock:
+            self._db.execute("DELETE FROM facts_fts")
+            self._db.commit()
+        self.upsert(items)
+        logger.info(f"🔎 Keyword index rebuilt ({len(items)} facts)")
+
+    def search(self, query: str, limit: int = 10, user: str = None, source: str = None,
+               since: float = None, until: float = None) -> list:
+        """
+        BM25-ranked fact ids, best first. Only facts containing at least
+        KEYWORD_MIN_MATCH of the query's content words count as hits.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Quote every token so FTS syntax in user text can't break the query
+        match = " OR ".join(f'"{t}"' for t in terms)
+        sql = "SELECT fact_id, document FROM facts_fts WHERE facts_fts MATCH ?"
+        params = [match]
+        if user:
+            sql += " AND user = ?"
+            params.append(user)
+        if source:
+            sql += " AND source = ?"
+            params.append(source)
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if until:
+            sql += " AND ts <= ?"
+            params.append(until)
+        sql += " ORDER BY bm25(facts_fts) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        needed = KEYWORD_MIN_MATCH * len(terms)
+        hits = []
+        for fact_id, document in rows:
+            words = set(_TOKEN.findall(document.lower()))
+            if sum(term in words for term in terms) >= needed:
+                hits.append(fact_id)
+        return hits
@@ -1,174 +1,312 @@
 import aiohttp
+import asyncio
 import os
 import logging
 from datetime import datetime
-import urllib.parse
+import heapq
+from itertools import islice
+from services.cache import TTLCache
+from services.state_store import store
+from services.entity_index import index
+from services.metrics import HASS_SECONDS
 
 logger = logging.getLogger(__name__)
 
 HASS_URL = os.getenv("HASS_URL", "http://host.docker.internal:8123")
 HASS_TOKEN = os.getenv("HASS_TOKEN")
 
+# Connection Pool Tuning
+HASS_POOL_SIZE = int(os.getenv("HASS_POOL_SIZE", "10"))
+HASS_MAX_CONCURRENCY = int(os.getenv("HASS_MAX_CONCURRENCY", "8"))
+HASS_TIMEOUT = float(os.getenv("HASS_TIMEOUT", "10"))
+
+# Calendar Fan-out
+CALENDAR_CONCURRENCY = int(os.getenv("CALENDAR_CONCURRENCY", "4"))
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "300"))
+MAX_EVENTS = 50
+
+# check_home: lines returned per call (the old full dump could pass 2000)
+CHECK_HOME_LIMIT = int(os.getenv("CHECK_HOME_LIMIT", "40"))
+USEFUL_DOMAINS = ["light", "switch", "sensor", "binary_sensor", "climate", "cover", "lock", "vacuum"]
+CRITICAL_KEYWORDS = ["ink", "printer", "lock", "garage", "battery", "smoke", "leak"]
+# States worth surfacing in the overview
+ACTIVE_STATES = {"on", "open", "opening", "unlocked", "heat", "cool", "heat_cool", "cleaning", "jammed"}
+ALERT_CLASSES = {"door", "garage_door", "window", "opening", "lock", "smoke", "moisture", "gas"}
+
 HEADERS = {
     "Authorization": f"Bearer {HASS_TOKEN}",
     "Content-Type": "application/json",
 }
 
+class HassClient:
+    """
+    Long-lived Home Assistant REST client.
+    One keep-alive connection pool shared by every tool call, with a per-request
+    timeout and a semaphore so a burst of tool calls can't flood HA.
+    """
+    def __init__(self, base_url: str = HASS_URL, headers: dict = HEADERS):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers
+        self.timeout = aiohttp.ClientTimeout(total=HASS_TIMEOUT)
+        self._session = None
+        self._limit = None
+
+    async def start(self):
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HASS_POOL_SIZE,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=connector,
+            timeout=self.timeout,
+        )
+        self._limit = asyncio.Semaphore(HASS_MAX_CONCURRENCY)
+        logger.info(f"🏠 HA client ready ({self.base_url}, pool={HASS_POOL_SIZE})")
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self._session
+
+    async def _ensure(self):
+        # Lazy start keeps scripts/one-off callers working without main.py
+        if self._session is None or self._session.closed:
+            await self.start()
+
+    async def get_json(self, path: str, params: dict = None, timeout: float = None):
+        """GET a JSON document. Returns (status, data); data is None on non-200."""
+        await self._ensure()
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self.timeout
+        async with self._limit:
+            with HASS_SECONDS.time(method="GET", endpoint=_endpoint(path)):
+                async with self._session.get(self.base_url + path, params=params, timeout=req_timeout) as resp:
+                    if resp.status == 200:
+                        return resp.status, await resp.json()
+                    return resp.status, None
+
+    async def ws_connect(self, url: str, **kwargs) -> aiohttp.ClientWebSocketResponse:
+        """Open a WebSocket over the shared session (use as `async with await ...`)."""
+        await self._ensure()
+        return await self._session.ws_connect(url, **kwargs)
+
+    async def post(self, path: str, payload: dict = None, timeout: float = None) -> int:
+        """POST a JSON payload. Returns the HTTP status."""
+        await self._ensure()
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self.timeout
+        async with self._limit:
+            with HASS_SECONDS.time(method="POST", endpoint=_endpoint(path)):
+                async with self._session.post(self.base_url + path, json=payload, timeout=req_timeout) as resp:
+                    await resp.read()
+                    return resp.status
+
+def _endpoint(path: str) -> str:
+    # /api/states/light.kitchen -> /api/states: one metric series per endpoint, not per entity
+    return "/".join(path.split("/")[:3])
+
+# Singleton Instance
+client = HassClient()
+
+# Per (calendar, start, end) event cache; version bumps on every invalidation
+_calendar_cache = TTLCache(maxsize=256, ttl=CALENDAR_CACHE_TTL)
+calendar_version = 0
+
 async def get_states():
-    """Fetch all states."""
-    async with aiohttp.ClientSession() as session:
+    """All states. Served from the WebSocket-fed store when live, else via REST."""
+    if store.ready:
+        return store.all()
+    return await fetch_states()
+
+async def fetch_states():
+    """Fetch all states from the REST API (bypasses the store)."""
+    try:
+        status, data = await client.get_json("/api/states")
+        return data if status == 200 else []
+    except Exception as e:
+        logger.error(f"Error fetching states: {e}")
+        return []
+
+def _parse_event_time(raw):
+    """Sort key for an event start. Aware times are converted to local naive time."""
+    if not raw:
+        return datetime.max
+    try:
+        dt = datetime.fromisoformat(raw)
+    except ValueError:
+        return datetime.max
+    if dt.tzinfo:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def invalidate_calendar(cal_id: str = None):
+    """Drop cached events for one calendar (or all of them)."""
+    global calendar_version
+    calendar_version += 1
+    if cal_id is None:
+        _calendar_cache.invalidate()
+    else:
+        _calendar_cache.invalidate(lambda key: key[0] == cal_id)
+
+def _on_state_change(entity_id, old_state, new_state):
+    # A calendar entity's state/attributes move whenever its upcoming events change
+    if entity_id.startswith("calendar."):
+        invalidate_calendar(entity_id)
+
+store.add_listener(_on_state_change)
+
+async def _fetch_calendar(cal_id: str, start_iso: str, end_iso: str, limit: asyncio.Semaphore) -> list:
+    """Events of one calendar as a list of (start, raw_start, summary, cal_id), sorted."""
+    key = (cal_id, start_iso, end_iso)
+    cached = _calendar_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async with limit:
         try:
-            async with session.get(f"{HASS_URL}/api/states", headers=HEADERS, timeout=10) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return []
-        except:
+            status, data = await client.get_json(
+                f"/api/calendars/{cal_id}", params={"start": start_iso, "end": end_iso}
+            )
+        except Exception as e:
+            logger.error(f"Error fetching {cal_id}: {e}")
             return []
+    if status != 200:
+        logger.error(f"Error fetching {cal_id}: HTTP {status}")
+        return []
+
+    # Data is list of dicts: {'summary': '...', 'start': ..., 'end': ...}
+    events = []
+    for event in data:
+        summary = event.get('summary', 'Busy')
+        # usually {'dateTime': '...'} or {'date': '...'}
+        start = event.get('start', {})
+        if isinstance(start, dict):
+            start = start.get('dateTime') or start.get('date')
+        events.append((_parse_event_time(start), start or "Unknown", summary, cal_id))
+    events.sort()
+    _calendar_cache.set(key, events)
+    return events
 
 async def get_events_range(start_date: str, end_date: str) -> str:
     """
     Fetch events from ALL calendars for the given range.
     Uses Home Assistant API: /api/calendars/{entity_id}?start={start}&end={end}
+    Calendars are queried concurrently and cached per (calendar, range).
     """
-    states = await get_states()
-    calendars = [s['entity_id'] for s in states if s['entity_id'].startswith('calendar.')]
+    if store.ready:
+        calendars = [s['entity_id'] for s in store.by_domain('calendar')]
+    else:
+        states = await get_states()
+        calendars = [s['entity_id'] for s in states if s['entity_id'].startswith('calendar.')]
     
     if not calendars:
         return "No calendars found."
     
-    # Need full ISO format for API usually, but simple date often works with recent HA.
-    # Let's ensure format is YYYY-MM-DD
     # start_date and end_date come from AI as YYYY-MM-DD strings.
-    
-    # API requires ISO with T usually? Let's try sticking T00:00:00 to start
     start_iso = f"{start_date}T00:00:00"
     end_iso = f"{end_date}T23:59:59"
     
-    # URL Encode
-    params = f"start={urllib.parse.quote(start_iso)}&end={urllib.parse.quote(end_iso)}"
-    
-    events_found = []
+    limit = asyncio.Semaphore(CALENDAR_CONCURRENCY)
+    per_calendar = await asyncio.gather(
+        *[_fetch_calendar(cal_id, start_iso, end_iso, limit) for cal_id in calendars]
+    )
     
-    async with aiohttp.ClientSession() as session:
-        for cal_id in calendars:
-            url = f"{HASS_URL}/api/calendars/{cal_id}?{params}"
-            try:
-                async with session.get(url, headers=HEADERS, timeout=10) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        # Data is list of dicts: {'summary': '...', 'start': ..., 'end': ...}
-                        for event in data:
-                            summary = event.get('summary', 'Busy')
-                            # clean start/end which are dicts or strings
-                            # usually {'dateTime': '...'} or {'date': '...'}
-                            start = event.get('start', {})
-                            dt = start.get('dateTime') or start.get('date') or "Unknown"
-                            
-                            events_found.append(f"- [{dt}] {summary} ({cal_id})")
-            except Exception as e:
-                logger.error(f"Error fetching {cal_id}: {e}")
-                
-    if not events_found:
+    # Merge the per-calendar sorted lists, stopping one past the safety limit
+    merged = list(islice(heapq.merge(*per_calendar), MAX_EVENTS + 1))
+    if not merged:
         return f"No events found between {start_date} and {end_date}."
     
-    # Sort by date
-    events_found.sort()
+    events_found = [f"- [{raw}] {summary} ({cal_id})" for _, raw, summary, cal_id in merged[:MAX_EVENTS]]
     
     # SAFETY LIMIT: Prevent context overflow if too many events
-    if len(events_found) > 50:
-        events_found = events_found[:50]
+    if len(merged) > MAX_EVENTS:
         events_found.append("... (List truncated. Please refine search range.)")
 
     return f"Events from {start_date} to {end_date}:\n" + "\n".join(events_found)
 
-async def get_dashboard_status() -> str:
+async def get_dashboard_status(query: str = None, area: str = None, domain: str = None) -> str:
     """
-    Returns a summarized text of important devices in the house.
-    Filters by useful domains (light, switch, sensor, binary_sensor, climate, cover).
+    Status of the devices matching query/area/domain, looked up in the entity index.
+    Without filters, a short overview (what's on/open/unlocked + counts) instead of every entity.
     """
-    states = await get_states()
-    if not states:
+    if store.ready:
+        lookup = store.get
+    else:
+        # Mirror not live: answer from a REST snapshot (and seed the index from it)
+        snapshot = {s["entity_id"]: s for s in await fetch_states()}
+        for eid, s in snapshot.items():
+            if eid not in index.entries:
+                index.update(eid, None, s)
+        lookup = snapshot.get
+    if not len(index):
         return "No connection to Home Assistant."
 
-    summary = []
-    useful_domains = ["light", "switch", "sensor", "binary_sensor", "climate", "cover", "lock", "vacuum"]
-    
-    for s in states:
-        entity_id = s['entity_id']
-        domain = entity_id.split('.')[0]
-        if domain in useful_domains:
-            name = s['attributes'].get('friendly_name', entity_id)
-            state = s['state']
-            unit = s['attributes'].get('unit_of_measurement', '')
-            
-            # Skip boring sensors unless they are critical
-            is_critical = any(k in entity_id for k in ['ink', 'printer', 'lock', 'garage', 'battery', 'smoke', 'leak'])
-            if state in ['unknown', 'unavailable'] and not is_critical:
-                continue
-                
-            summary.append(f"{name} ({entity_id}): {state}{unit}")
-            
-    return "\n".join(summary[:2000]) # Increased limit significantly for Gemini Context
+    if not (query or area or domain):
+        return _overview(lookup)
+
+    entries = index.search(query, area, domain, domains=None if domain else USEFUL_DOMAINS, limit=CHECK_HOME_LIMIT * 2)
+    lines = [line for line in (_status_line(e, lookup(e.entity_id)) for e in entries) if line]
+    if not lines:
+        return f"No devices found for {query or ''} {area or ''} {domain or ''}".strip() + ". Try a broader search."
+    more = len(lines) - CHECK_HOME_LIMIT
+    lines = lines[:CHECK_HOME_LIMIT]
+    if more > 0:
+        lines.append(f"...and {more} more. Narrow it down with area or domain.")
+    return "\n".join(lines)
+
+def _status_line(entry, s: dict) -> str:
+    """One 'Name (entity_id): state' line, or None for uninteresting unavailable sensors."""
+    if s is None:
+        return None
+    state = s.get("state")
+    # Skip boring sensors unless they are critical
+    is_critical = any(k in entry.entity_id for k in CRITICAL_KEYWORDS)
+    if state in ("unknown", "unavailable") and not is_critical:
+        return None
+    unit = s.get("attributes", {}).get("unit_of_measurement", "")
+    where = f" [{entry.area}]" if entry.area else ""
+    return f"{entry.name} ({entry.entity_id}): {state}{unit}{where}"
+
+def _overview(lookup) -> str:
+    active, counts = [], {}
+    for domain in USEFUL_DOMAINS:
+        entries = index.search(domain=domain, limit=len(index))
+        counts[domain] = len(entries)
+        for entry in entries:
+            s = lookup(entry.entity_id)
+            if s and s.get("state") in ACTIVE_STATES and (domain != "binary_sensor" or entry.device_class in ALERT_CLASSES):
+                active.append(_status_line(entry, s) or f"{entry.name} ({entry.entity_id})")
+    lines = ["Active right now:"] + (active[:CHECK_HOME_LIMIT] or ["(nothing on, open or unlocked)"])
+    lines.append("Devices: " + ", ".join(f"{n} {d}" for d, n in counts.items() if n))
+    lines.append("For anything else, call check_home with a query, area or domain.")
+    return "\n".join(lines)
 
 
 async def call_action(domain: str, service: str, entity_id: str) -> str:
     """
     Generic Service Call. e.g. light.turn_on
     """
-    url = f"{HASS_URL}/api/services/{domain}/{service}"
     payload = {"entity_id": entity_id}
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, headers=HEADERS, json=payload) as resp:
-                if resp.status == 200:
-                    return f"success: called {domain}.{service} on {entity_id}"
-                return f"failed: {resp.status}"
-        except Exception as e:
-            return f"error: {e}"
+    try:
+        status = await client.post(f"/api/services/{domain}/{service}", payload)
+        if status == 200:
+            return f"success: called {domain}.{service} on {entity_id}"
+        return f"failed: {status}"
+    except Exception as e:
+        return f"error: {e}"
 
 async def activate_scene(scene_id: str) -> bool:
     """Activates a Home Assistant Scene"""
-    url = f"{HASS_URL}/api/services/scene/turn_on"
     payload = {"entity_id": scene_id}
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, headers=HEADERS, json=payload) as resp:
-                return resp.status == 200
-        except:
-            return False
-
-async def get_security_dashboard() -> str:
-    """
-    Returns a text summary of ALL potential security entities for AI analysis.
-    Auto-detects: locks, covers, binary_sensors (door/lock), and sensors with 'lock'/'door' in name.
-    """
-    states = await get_states()
-    summary = []
-    
-    for s in states:
-        eid = s.get("entity_id", "")
-        name = s.get("attributes", {}).get("friendly_name", eid)
-        state = s.get("state")
-        domain = eid.split(".")[0]
-        
-        # Generic Discovery Logic
-        is_security = False
-        
-        if domain in ["lock", "cover", "alarm_control_panel"]:
-            is_security = True
-        elif domain == "binary_sensor":
-            dev_class = s.get("attributes", {}).get("device_class")
-            if dev_class in ["door", "garage_door", "lock", "window", "opening"]:
-                is_security = True
-        
-        # Keyword Fallback (for weird things like sensor.mercedes_lock)
-        if not is_security:
-            if "lock" in eid or "door" in eid or "garage" in eid or "gate" in eid:
-                is_security = True
-        
-        if is_security:
-            summary.append(f"- {name} ({eid}): {state}")
-            
-    return "\n".join(summary)
+    try:
+        return await client.post("/api/services/scene/turn_on", payload) == 200
+    except:
+        return False
@@ -0,0 +1,117 @@
+import os
+import re
+import logging
+from services import hass
+from services.state_store import store
+from services.entity_index import index, normalize
+
+logger = logging.getLogger(__name__)
+
+# Simple commands are answered here, without an LLM round-trip
+FAST_INTENTS = os.getenv("FAST_INTENTS", "true").lower() == "true"
+# Minimum name similarity, and lead over the runner-up, to act without asking the LLM
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "0.82"))
+INTENT_MIN_MARGIN = 0.08
+
+# (pattern, action). Patterns see normalized text: lowercase, no punctuation or filler.
+PATTERNS = [
+    (re.compile(r"^(?:turn|switch)\s+(?P<verb>on|off)\s+(?P<target>.+)$"), "control"),
+    (re.compile(r"^(?:turn|switch)\s+(?P<target>.+?)\s+(?P<verb>on|off)$"), "control"),
+    # No "unlock": opening up the house always goes through the LLM
+    (re.compile(r"^(?P<verb>lock|open|close)\s+(?P<target>.+)$"), "control"),
+    (re.compile(r"^(?:is|are)\s+(?P<target>.+?)\s+(?P<verb>on|off|open|closed|locked|unlocked)$"), "query"),
+]
+
+# verb -> {domain: service}
+SERVICES = {
+    "on": {d: "turn_on" for d in ("light", "switch", "fan", "input_boolean", "media_player", "climate", "humidifier")},
+    "off": {d: "turn_off" for d in ("light", "switch", "fan", "input_boolean", "media_player", "climate", "humidifier")},
+    "lock": {"lock": "lock"},
+    "open": {"cover": "open_cover", "valve": "open_valve"},
+    "close": {"cover": "close_cover", "valve": "close_valve"},
+}
+
+DONE = {"on": "turned on", "off": "turned off", "lock": "locking", "open": "opening", "close": "closing"}
+
+# Covers the fast path may open; garage doors, gates and unclassified covers need the LLM
+OPENABLE_COVERS = {"blind", "curtain", "shade", "shutter", "awning", "damper"}
+# When a device and its own sensor tie on a question, answer from the device
+ACTUATOR_DOMAINS = {"light", "switch", "fan", "input_boolean", "media_player", "climate", "cover", "valve", "lock"}
+
+# verb -> {domain: states that mean "yes"}
+QUERY_STATES = {
+    "on": {"light": {"on"}, "switch": {"on"}, "fan": {"on"}, "input_boolean": {"on"}, "binary_sensor": {"on"},
+           "media_player": {"on", "playing", "paused", "idle"}, "climate": {"heat", "cool", "heat_cool", "auto", "dry", "fan_only"}},
+    "off": {"light": {"off"}, "switch": {"off"}, "fan": {"off"}, "input_boolean": {"off"}, "binary_sensor": {"off"},
+            "media_player": {"off", "standby"}, "climate": {"off"}},
+    "open": {"cover": {"open", "opening"}, "valve": {"open", "opening"}, "binary_sensor": {"on"}, "lock": {"unlocked", "open"}},
+    "closed": {"cover": {"closed", "closing"}, "valve": {"closed", "closing"}, "binary_sensor": {"off"}, "lock": {"locked"}},
+    "locked": {"lock": {"locked"}},
+    "unlocked": {"lock": {"unlocked", "open"}},
+}
+
+# Opening-type sensors only; a motion sensor is never "open"
+OPENING_CLASSES = {"door", "garage_door", "window", "opening", "lock"}
+
+def _accept(verb: str):
+    if verb not in ("open", "closed"):
+        return None
+    return lambda entry: entry.domain != "binary_sensor" or entry.device_class in OPENING_CLASSES
+
+def _sensitive(verb: str, entry) -> bool:
+    """Opening a garage door/gate is never done on a name match alone."""
+    return verb == "open" and entry.domain == "cover" and entry.device_class not in OPENABLE_COVERS
+
+def _name(state: dict) -> str:
+    return state.get("attributes", {}).get("friendly_name", state["entity_id"])
+
+async def handle(text: str):
+    """
+    Answer simple device commands and state questions directly.
+    Returns the reply, or None to fall back to the LLM.
+    """
+    if not FAST_INTENTS or not store.ready:
+        return None
+    text = normalize(text)
+    for pattern, action in PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        verb, target = match.group("verb"), match.group("target")
+        # Compound requests ("the hall and the porch") are the LLM's job
+        if " and " in f" {target} ":
+            return None
+        table = SERVICES if action == "control" else QUERY_STATES
+        entry = index.resolve(target, table[verb], _accept(verb), INTENT_MIN_SCORE, INTENT_MIN_MARGIN,
+                              prefer=ACTUATOR_DOMAINS)
+        if entry and action == "control" and _sensitive(verb, entry):
+            logger.info(f"⚡ Intent '{verb}' on {entry.entity_id} needs the LLM")
+            return None
+        entity = store.get(entry.entity_id) if entry else None
+        if entity is None:
+            logger.info(f"⚡ Intent '{action}:{verb}' not confident for '{target}', using LLM")
+            return None
+        if action == "control":
+            return await _control(verb, entity)
+        return _query(verb, entity)
+    return None
+
+async def _control(verb: str, state: dict) -> str:
+    eid = state["entity_id"]
+    domain = eid.split(".")[0]
+    service = SERVICES[verb][domain]
+    result = await hass.call_action(domain, service, eid)
+    logger.info(f"⚡ Fast intent: {domain}.{service} on {eid} -> {result}")
+    if result.startswith("success"):
+        return f"✅ {_name(state)} {DONE[verb]}."
+    return f"⚠️ {_name(state)}: {result}"
+
+def _query(verb: str, state: dict) -> str:
+    domain = state["entity_id"].split(".")[0]
+    current = state.get("state")
+    if current in ("unknown", "unavailable"):
+        return f"🤷 {_name(state)} is {current} right now."
+    answer = "Yes" if current in QUERY_STATES[verb][domain] else "No"
+    if domain == "binary_sensor" and verb in ("open", "closed"):
+        current = {"on": "open", "off": "closed"}.get(current, current)
+    return f"{answer}, {_name(state)} is {current}."
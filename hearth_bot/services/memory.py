@@ -1,79 +1,425 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import asyncio
 import logging
 import os
+import threading
+import time
+from services.fact_index import FactIndex, to_epoch
+from services.metrics import MEMORY_SECONDS
 
 logger = logging.getLogger(__name__)
 
 # Persistent Data Path
-DB_PATH = "/app/hearth_data/chroma"
+DATA_DIR = os.getenv("HEARTH_DATA_DIR", "/app/hearth_data")
+DB_PATH = os.path.join(DATA_DIR, "chroma")
+EMBED_CACHE_PATH = os.path.join(DATA_DIR, "embeddings.db")
+FACT_INDEX_PATH = os.path.join(DATA_DIR, "facts_fts.db")
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+# Tuning
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "16"))
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "2.0"))
+# How long a tool call waits for the background warm-up before giving up
+MEMORY_READY_TIMEOUT = float(os.getenv("MEMORY_READY_TIMEOUT", "20"))
+# Near-duplicate detection: cosine similarity against the top-k stored neighbours
+DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.92"))
+DEDUP_NEIGHBORS = 3
+# Background compaction (expired facts + duplicate merge); 0 disables
+MEMORY_COMPACT_HOURS = float(os.getenv("MEMORY_COMPACT_HOURS", "24"))
+# Hybrid retrieval: reciprocal-rank fusion of BM25 + vector results
+RRF_K = 60
+# Vector-only hits below this cosine similarity are dropped (keyword hits are gated in FactIndex.search)
+MEMORY_MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.3"))
+# Pre-retrieval: facts injected into the prompt must clear a stricter bar, quickly
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", "0.5"))
+PREFETCH_TIMEOUT = float(os.getenv("PREFETCH_TIMEOUT", "1.5"))
+PREFETCH_RESULTS = 3
 
 class MemoryService:
+    """
+    Long-term fact memory (Chroma + local embeddings).
+    Nothing heavy happens at import: call start() to load the model and open
+    Chroma in the background, and wait_ready() before using it.
+    """
     def __init__(self):
         self.client = None
         self.collection = None
-        self.init_db()
+        self.embedder = None
+        self.index = None
+        # Write-behind buffer of (id, text, meta), flushed as one collection.add
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # Serializes duplicate check + insert, flush and compaction
+        self._save_lock = threading.Lock()
+        self._flush_timer = None
+        self._ready = asyncio.Event()
+        self._warm_task = None
+        self._compact_task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self):
+        """Kick off the background warm-up (idempotent) and the compaction job."""
+        if self._warm_task is None:
+            self._warm_task = asyncio.create_task(self._warm())
+            if MEMORY_COMPACT_HOURS > 0:
+                self._compact_task = asyncio.create_task(self.compaction_loop())
+
+    async def _warm(self):
+        from services.executor import run_cpu
+        started = time.perf_counter()
+        try:
+            await run_cpu(self.init_db)
+        finally:
+            # Set even on failure: callers then see "Memory Offline." instead of waiting
+            self._ready.set()
+        logger.info(f"⏱️ Memory warm-up took {time.perf_counter() - started:.1f}s")
+
+    async def wait_ready(self, timeout: float = MEMORY_READY_TIMEOUT) -> bool:
+        """Wait for the warm-up. False if it is still loading after `timeout`."""
+        self.start()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
 
     def init_db(self):
         try:
+            # Heavy imports (torch, sentence-transformers, chromadb) happen here, not at import time
+            import chromadb
+            from chromadb.utils import embedding_functions
+            from services.embeddings import CachedEmbeddingFunction
+
             # Ensure path exists
             os.makedirs(DB_PATH, exist_ok=True)
-            
+
             # Using HuggingFace Embeddings (runs locally in simple python process)
             ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name="all-MiniLM-L6-v2"
+                model_name=EMBED_MODEL
             )
-            
+            self.embedder = CachedEmbeddingFunction(ef, EMBED_MODEL, EMBED_CACHE_PATH)
+            # First inference pays one-off setup cost; do it now rather than on a user's query
+            self.embedder.inner(["warm-up"])
+
             self.client = chromadb.PersistentClient(path=DB_PATH)
-            
+
             self.collection = self.client.get_or_create_collection(
                 name="hearth_facts",
-                embedding_function=ef
+                embedding_function=self.embedder
             )
+            self.index = FactIndex(FACT_INDEX_PATH)
+            if self.index.count() != self.collection.count():
+                data = self.collection.get(include=["documents", "metadatas"])
+                self.index.rebuild(list(zip(data["ids"], data["documents"], data["metadatas"])))
             logger.info(f"🧠 Memory System Initialized at {DB_PATH}")
         except Exception as e:
             logger.error(f"❌ Memory Init Failed: {e}")
 
-    def save_fact(self, text: str, meta: dict = None) -> bool:
-        """Store a fact in long-term memory."""
+    def _prepare(self, text: str, meta: dict = None, ttl_days: float = None):
+        import uuid
+        # Metadata can include 'source', 'user', 'timestamp', 'expires_at'
+        meta = dict(meta or {})
+        if "timestamp" not in meta:
+            from datetime import datetime
+            meta["timestamp"] = datetime.now().isoformat()
+        if ttl_days:
+            meta["expires_at"] = time.time() + float(ttl_days) * 86400
+        vector = self.embedder([text])[0]
+        return (str(uuid.uuid4()), text, meta, vector)
+
+    def _find_duplicate(self, vector: list):
+        """
+        Nearest stored (or queued) fact with cosine similarity >= MEMORY_DEDUP_THRESHOLD.
+        Returns (id, meta, similarity, is_pending) or None.
+        """
+        best = None
+        with self._pending_lock:
+            for fact_id, _, meta, other in self._pending:
+                sim = _cosine(vector, other)
+                if sim >= DEDUP_THRESHOLD and (best is None or sim > best[2]):
+                    best = (fact_id, meta, sim, True)
+
+        count = self.collection.count()
+        if count:
+            results = self.collection.query(
+                query_embeddings=[vector],
+                n_results=min(DEDUP_NEIGHBORS, count),
+                include=["embeddings", "metadatas"],
+            )
+            for fact_id, meta, other in zip(results["ids"][0], results["metadatas"][0], results["embeddings"][0]):
+                sim = _cosine(vector, other)
+                if sim >= DEDUP_THRESHOLD and (best is None or sim > best[2]):
+                    best = (fact_id, meta or {}, sim, False)
+        return best
+
+    @MEMORY_SECONDS.time(op="save_fact")
+    def save_fact(self, text: str, meta: dict = None, ttl_days: float = None) -> bool:
+        """
+        Store a fact in long-term memory (written in batches).
+        A near-duplicate of an existing fact supersedes it instead of adding a new one.
+        """
         if not self.collection: return False
         try:
-            import uuid
-            # Metadata can include 'source', 'user', 'timestamp'
-            if meta is None: meta = {}
-            if "timestamp" not in meta:
-                from datetime import datetime
-                meta["timestamp"] = datetime.now().isoformat()
-            
-            self.collection.add(
-                documents=[text],
-                metadatas=[meta],
-                ids=[str(uuid.uuid4())]
-            )
-            logger.info(f"🧠 Remembered: {text}")
-            return True
+            with self._save_lock:
+                fact_id, text, meta, vector = self._prepare(text, meta, ttl_days)
+                dup = self._find_duplicate(vector)
+                if dup:
+                    self._supersede(dup, text, meta, vector)
+                    return True
+                with self._pending_lock:
+                    self._pending.append((fact_id, text, meta, vector))
+                    full = len(self._pending) >= MEMORY_BATCH_SIZE
+                    if not full and self._flush_timer is None:
+                        self._flush_timer = threading.Timer(MEMORY_FLUSH_INTERVAL, self.flush)
+                        self._flush_timer.daemon = True
+                        self._flush_timer.start()
+        except Exception as e:
+            logger.error(f"Save Fact Error: {e}")
+            return False
+        if full:
+            return self.flush()
+        logger.info(f"🧠 Remembered: {text}")
+        return True
+
+    def _supersede(self, dup, text: str, meta: dict, vector: list):
+        """Replace a near-duplicate's text/metadata in place, keeping its id."""
+        old_id, old_meta, sim, is_pending = dup
+        merged = {**old_meta, **meta}
+        merged["created"] = old_meta.get("created", old_meta.get("timestamp", meta["timestamp"]))
+        merged["revisions"] = int(old_meta.get("revisions", 0)) + 1
+        if "expires_at" not in meta:
+            # A fresh restatement without a TTL makes the fact permanent again
+            merged.pop("expires_at", None)
+        if is_pending:
+            with self._pending_lock:
+                self._pending = [
+                    (old_id, text, merged, vector) if fact_id == old_id else (fact_id, t, m, v)
+                    for fact_id, t, m, v in self._pending
+                ]
+        else:
+            if "expires_at" not in merged and "expires_at" in old_meta:
+                # Chroma merges metadata on update; delete + add clears the stale key
+                self.collection.delete(ids=[old_id])
+                self.collection.add(ids=[old_id], documents=[text], metadatas=[merged], embeddings=[vector])
+            else:
+                self.collection.update(ids=[old_id], documents=[text], metadatas=[merged], embeddings=[vector])
+            self.index.upsert([(old_id, text, merged)])
+        logger.info(f"🧠 Updated (similarity {sim:.2f}): {text}")
+
+    def save_facts(self, texts: list, metas: list = None) -> bool:
+        """Bulk import: embed and add all facts in one batch (no duplicate check)."""
+        if not self.collection: return False
+        metas = metas or [None] * len(texts)
+        try:
+            prepared = [self._prepare(text, meta) for text, meta in zip(texts, metas)]
         except Exception as e:
             logger.error(f"Save Fact Error: {e}")
             return False
+        with self._pending_lock:
+            self._pending.extend(prepared)
+        return self.flush()
+
+    @MEMORY_SECONDS.time(op="flush")
+    def flush(self) -> bool:
+        """Write all queued facts with a single collection.add."""
+        # Held across swap + add: a concurrent save_fact must see the batch
+        # either in _pending or in the collection, never in neither
+        with self._save_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            if not batch:
+                return True
+            ids, docs, metas, vectors = zip(*batch)
+            try:
+                self.collection.add(
+                    documents=list(docs), metadatas=list(metas), ids=list(ids), embeddings=list(vectors)
+                )
+            except Exception as e:
+                # Keep the facts queued; the next save, search or shutdown flush retries
+                with self._pending_lock:
+                    self._pending = batch + self._pending
+                logger.error(f"Save Fact Error ({len(batch)} fact(s) kept queued): {e}")
+                return False
+            try:
+                self.index.upsert(list(zip(ids, docs, metas)))
+            except Exception as e:
+                logger.error(f"Keyword index update failed: {e}")
+            logger.info(f"🧠 Stored {len(batch)} fact(s)")
+            return True
+
+    @MEMORY_SECONDS.time(op="search")
+    def search(self, query_text: str, n_results: int = 3, user: str = None, source: str = None,
+               since: float = None, until: float = None, min_similarity: float = MEMORY_MIN_SIMILARITY) -> list:
+        """
+        Hybrid retrieval: BM25 keyword hits and vector neighbours fused with
+        reciprocal-rank fusion. Filters: user, source, and a since/until epoch window.
+        Returns dicts {id, text, meta, score, similarity}, best first.
+        """
+        # Read-your-writes: make queued facts searchable first
+        self.flush()
+        count = self.collection.count()
+        if not count:
+            return []
+        candidates = min(max(n_results * 4, 10), count)
+        now = time.time()
 
-    def query_facts(self, query_text: str, n_results: int = 3) -> str:
-        """Semantic search for facts."""
+        # 1. Vector Search (Chroma only does equality filters; the time window is applied below)
+        where = {key: value for key, value in (("user", user), ("source", source)) if value}
+        if len(where) > 1:
+            where = {"$and": [{key: value} for key, value in where.items()]}
+        with MEMORY_SECONDS.time(op="embed"):
+            query_vector = self.embedder([query_text])[0]
+        results = self.collection.query(
+            query_embeddings=[query_vector],
+            n_results=candidates,
+            where=where or None,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        docs = {}
+        vector_ranked = []
+        for fact_id, doc, meta, vector in zip(results["ids"][0], results["documents"][0],
+                                              results["metadatas"][0], results["embeddings"][0]):
+            meta = meta or {}
+            ts = _timestamp(meta)
+            if _expired(meta, now) or (since and ts < since) or (until and ts > until):
+                continue
+            similarity = _cosine(query_vector, vector)
+            docs[fact_id] = {"id": fact_id, "text": doc, "meta": meta, "similarity": similarity}
+            if similarity >= min_similarity:
+                vector_ranked.append(fact_id)
+
+        # 2. Keyword Search (BM25)
+        keyword_ranked = self.index.search(query_text, candidates, user=user, source=source, since=since, until=until)
+        missing = [fact_id for fact_id in keyword_ranked if fact_id not in docs]
+        if missing:
+            extra = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for fact_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+                meta = meta or {}
+                if not _expired(meta, now):
+                    docs[fact_id] = {"id": fact_id, "text": doc, "meta": meta, "similarity": None}
+        keyword_ranked = [fact_id for fact_id in keyword_ranked if fact_id in docs]
+
+        # 3. Reciprocal-Rank Fusion
+        scores = {}
+        for ranking in (vector_ranked, keyword_ranked):
+            for rank, fact_id in enumerate(ranking):
+                scores[fact_id] = scores.get(fact_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        return [{**docs[fact_id], "score": round(scores[fact_id], 5)} for fact_id in best]
+
+    def query_facts(self, query_text: str, n_results: int = 3, **filters) -> str:
+        """Hybrid search for facts, formatted for the LLM."""
         if not self.collection: return "Memory Offline."
         try:
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=n_results
-            )
-            
-            # Formatting results
-            facts = results['documents'][0]
+            facts = self.search(query_text, n_results, **filters)
             if not facts:
                 return "No relevant memories found."
-            
-            return "\n".join([f"- {fact}" for fact in facts])
+
+            return "\n".join([f"- {fact['text']}" for fact in facts])
         except Exception as e:
              logger.error(f"Query Error: {e}")
              return "Error accessing memory."
 
+    async def prefetch(self, query_text: str, n_results: int = PREFETCH_RESULTS,
+                       threshold: float = PREFETCH_MIN_SIMILARITY, timeout: float = PREFETCH_TIMEOUT) -> list:
+        """
+        Cheap lookup run alongside prompt setup, so likely-relevant facts can go
+        straight into the system prompt. Never waits for warm-up; returns [] on
+        timeout or error so it can't delay the reply.
+        """
+        if not self.ready or not self.collection or not query_text.strip():
+            return []
+        from services.executor import run_cpu
+        try:
+            with MEMORY_SECONDS.time(op="prefetch"):
+                results = await asyncio.wait_for(
+                    run_cpu(self.search, query_text, n_results, min_similarity=threshold), timeout
+                )
+        except asyncio.TimeoutError:
+            logger.info("Memory prefetch timed out")
+            return []
+        except Exception as e:
+            logger.error(f"Prefetch Error: {e}")
+            return []
+        return [r["text"] for r in results if r["similarity"] is not None and r["similarity"] >= threshold]
+
+    @MEMORY_SECONDS.time(op="compact")
+    def compact(self) -> dict:
+        """
+        Drop expired facts and merge near-duplicates (newest wins).
+        Returns collection/index stats for logging.
+        """
+        if not self.collection: return {}
+        import numpy as np
+        self.flush()
+        with self._save_lock:
+            data = self.collection.get(include=["embeddings", "metadatas"])
+            ids = data["ids"]
+            metas = [m or {} for m in data["metadatas"]]
+            before = len(ids)
+
+            now = time.time()
+            expired = [fact_id for fact_id, meta in zip(ids, metas) if _expired(meta, now)]
+
+            # Greedy clustering, newest first: a fact is a duplicate if it is too close to one we kept
+            live = [i for i, meta in enumerate(metas) if not _expired(meta, now)]
+            live.sort(key=lambda i: metas[i].get("timestamp", ""), reverse=True)
+            merged = []
+            if live:
+                vectors = np.asarray([data["embeddings"][i] for i in live], dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+                kept = []
+                for row, i in enumerate(live):
+                    if kept and float(np.max(vectors[kept] @ vectors[row])) >= DEDUP_THRESHOLD:
+                        merged.append(ids[i])
+                    else:
+                        kept.append(row)
+
+            doomed = expired + merged
+            if doomed:
+                self.collection.delete(ids=doomed)
+                self.index.delete(doomed)
+
+        stats = {
+            "facts_before": before,
+            "facts_after": self.collection.count(),
+            "expired_removed": len(expired),
+            "duplicates_merged": len(merged),
+            "index": dict(self.collection.metadata or {}),
+            "embedding_cache": self.embedder.stats(),
+        }
+        logger.info(f"🧹 Memory compaction: {stats}")
+        return stats
+
+    async def compaction_loop(self, interval_hours: float = MEMORY_COMPACT_HOURS):
+        """Periodic compaction job, run on the CPU pool."""
+        from services.executor import run_cpu
+        await self._ready.wait()
+        while True:
+            try:
+                await run_cpu(self.compact)
+            except Exception as e:
+                logger.error(f"Compaction Error: {e}")
+            await asyncio.sleep(interval_hours * 3600)
+
+def _cosine(a, b) -> float:
+    import numpy as np
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denom if denom else 0.0
+
+def _timestamp(meta: dict) -> float:
+    return to_epoch(meta.get("timestamp"))
+
+def _expired(meta: dict, now: float) -> bool:
+    expires = (meta or {}).get("expires_at")
+    return bool(expires) and float(expires) < now
+
 # Singleton Instance
 memory = MemoryService()
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached lookup (ms) up to a slow Pi generation (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + body + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+        return lines
+
+    def total(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label set. Thread-safe."""
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., +Inf], sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def summary(self) -> dict:
+        """label key -> {count, mean, p50, p95} (percentiles estimated from bucket bounds)."""
+        out = {}
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, count) in series.items():
+            if not count:
+                continue
+            out[key] = {
+                "count": count,
+                "mean": total / count,
+                "p50": self._quantile(counts, count, 0.5),
+                "p95": self._quantile(counts, count, 0.95),
+            }
+        return out
+
+    def _quantile(self, counts: list, count: int, q: float) -> float:
+        target = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def add_collector(self, collect):
+        """collect() -> [(name, help, {labels}, value)], read at scrape time as gauges."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        gauges = {}
+        for collect in self._collectors:
+            try:
+                for name, help_text, labels, value in collect():
+                    gauges.setdefault(name, (help_text, []))[1].append((labels, value))
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        for name, (help_text, samples) in gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_format_labels(_label_key(labels))} {float(value):g}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Pipeline
+STAGE_SECONDS = registry.histogram("hearth_stage_seconds", "Time per chat pipeline stage.")
+REQUEST_SECONDS = registry.histogram("hearth_request_seconds", "End-to-end request time by front end and path (fast/llm).")
+# LLM
+LLM_SECONDS = registry.histogram("hearth_llm_seconds", "LLM answer time per provider attempt, tool rounds included.")
+LLM_CALL_SECONDS = registry.histogram("hearth_llm_call_seconds", "Time per single model call (one agent round).")
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("hearth_llm_first_token_seconds", "Time to first streamed token.")
+OLLAMA_PROMPT_EVAL_SECONDS = registry.histogram("hearth_ollama_prompt_eval_seconds", "Ollama prompt evaluation time per call.")
+OLLAMA_EVAL_SECONDS = registry.histogram("hearth_ollama_eval_seconds", "Ollama generation time per call.")
+LLM_TOKENS = registry.counter("hearth_llm_tokens_total", "Tokens by provider and kind (prompt/generated).")
+# Tools and backends
+TOOL_SECONDS = registry.histogram("hearth_tool_seconds", "Tool execution time.")
+HASS_SECONDS = registry.histogram("hearth_hass_request_seconds", "Home Assistant REST call time.")
+MEMORY_SECONDS = registry.histogram("hearth_memory_seconds", "MemoryService operation time.")
+DB_SECONDS = registry.histogram("hearth_db_seconds", "SQLite operation time.")
+
+def _standard_gauges() -> list:
+    from services import executor
+    from services.response_cache import responses
+    from services.scheduler import scheduler
+    from services.providers import providers
+    from services.state_store import store
+    from services.entity_index import index
+    samples = []
+    for key, value in responses.stats().items():
+        samples.append(("hearth_response_cache", "Response cache counters.", {"stat": key}, value))
+    for key, value in scheduler.stats().items():
+        samples.append(("hearth_scheduler", "LLM scheduler state.", {"stat": key}, value))
+    for pool, stats in executor.stats().items():
+        for key, value in stats.items():
+            samples.append(("hearth_executor", "Thread pool state.", {"pool": pool, "stat": key}, value))
+    for name, stats in providers.stats().items():
+        for key in ("healthy", "ttft_ms", "latency_ms", "requests", "failures", "hedges"):
+            if stats[key] is not None:
+                samples.append(("hearth_provider", "LLM provider health and latency (EWMA).",
+                                {"provider": name, "stat": key}, stats[key]))
+    samples.append(("hearth_ha_entities", "Entities in the state mirror.", {}, len(store.states)))
+    samples.append(("hearth_ha_live", "1 while the HA WebSocket mirror is live.", {}, store.ready))
+    samples.append(("hearth_entity_index_size", "Entities in the name index.", {}, len(index)))
+    return samples
+
+registry.add_collector(_standard_gauges)
+
+def render() -> str:
+    return registry.render()
+
+def summary() -> str:
+    """Short human-readable digest for the /stats command."""
+    lines = ["📊 Stage latency (p50 / p95, count)"]
+    for histogram in (REQUEST_SECONDS, STAGE_SECONDS, LLM_SECONDS, LLM_CALL_SECONDS, TOOL_SECONDS,
+                      MEMORY_SECONDS, HASS_SECONDS, DB_SECONDS):
+        for key, s in sorted(histogram.summary().items()):
+            name = "/".join(value for _, value in key)
+            lines.append(f"• {histogram.name[7:-8]} {name}: {_fmt(s['p50'])} / {_fmt(s['p95'])} ({s['count']})")
+    from services.response_cache import responses
+    from services.scheduler import scheduler
+    cache = responses.stats()
+    sched = scheduler.stats()
+    lines.append(f"💾 Response cache: {cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate']:.0%})")
+    lines.append(f"🚦 Scheduler: {sched['running']} running, {sched['waiting']} waiting, {sched['superseded']} superseded")
+    for provider in ("ollama", "gemini"):
+        prompt = LLM_TOKENS.total(provider=provider, kind="prompt")
+        generated = LLM_TOKENS.total(provider=provider, kind="generated")
+        if prompt or generated:
+            lines.append(f"🔤 {provider} tokens: {prompt:g} prompt / {generated:g} generated")
+    return "\n".join(lines)
+
+def _fmt(seconds: float) -> str:
+    if seconds == float("inf"):
+        return ">120s"
+    return f"≤{seconds * 1000:.0f}ms" if seconds < 1 else f"≤{seconds:g}s"
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from services.ai import ask_llm, is_error_reply
+from services.prompts import build_system_prompt
+from services.conversation import conversations
+from services.memory import memory
+from services import intents
+from services.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Shared by every front end (Telegram, the HTTP API). Callers set
+# services.tools.request_context before calling in.
+
+async def fast_path(user_text: str, chat_key: str = None):
+    """Simple device commands/questions, answered without the LLM. None if not handled."""
+    with STAGE_SECONDS.time(stage="fast_path"):
+        quick = await intents.handle(user_text)
+    if quick and chat_key:
+        await conversations.append(chat_key, user_text, quick)
+    return quick
+
+async def ask(user_text: str, chat_key: str = None, stream=None, history: list = None, speaker: str = None,
+              status=None) -> str:
+    """
+    Full LLM answer. History comes from the conversation store under chat_key,
+    unless the caller supplies its own (and passes no chat_key, so nothing is stored).
+    May return a __REQ_PERM__ marker; raises scheduler.Superseded.
+    """
+    with STAGE_SECONDS.time(stage="context"):
+        if history is None and chat_key:
+            # History and a memory pre-lookup run side by side
+            history, facts = await asyncio.gather(
+                conversations.history(chat_key),
+                memory.prefetch(user_text),
+            )
+        else:
+            facts = await memory.prefetch(user_text)
+    # Cached base prompt (rebuilt on config change or new day) + any recalled facts
+    with STAGE_SECONDS.time(stage="prompt"):
+        system_prompt = await build_system_prompt(facts, speaker)
+
+    # Recalled family facts keep the request on the local model
+    with STAGE_SECONDS.time(stage="llm"):
+        response = await ask_llm(
+            user_text, system_prompt=system_prompt, chat_history=history, stream=stream,
+            conversation_id=chat_key, private=bool(facts), status=status
+        )
+    if chat_key and not is_error_reply(response) and not response.startswith("__REQ_PERM__"):
+        with STAGE_SECONDS.time(stage="history_save"):
+            await conversations.append(chat_key, user_text, response)
+    return response
@@ -0,0 +1,71 @@
+import logging
+from datetime import datetime
+from string import Template
+import database
+
+logger = logging.getLogger(__name__)
+
+# Compiled once at import. Static instructions come FIRST and the volatile
+# parts (family, date) LAST, so every turn shares a byte-identical prefix and
+# Ollama can reuse its KV cache for it instead of re-evaluating the prompt.
+CHAT_RULES = (
+    "You are Hearth, a helpful AI assistant for a family household.\n"
+    "Your goal is to be helpful, concise, and polite.\n"
+    "You have access to Long-Term Memory tools: 'remember_fact' and 'search_memory'.\n"
+    "- If the user tells you a fact (e.g. 'My gate code is 1234'), use 'remember_fact'.\n"
+    "- If asked a question you might know from the past, use 'search_memory'.\n"
+    "You also have access to the Internet via 'web_search' tool. Use it for current events/news.\n"
+    "If asked about the house or calendar, use the tools provided.\n"
+    "IMPORTANT: When asked for 'this week', calculate start_date=today and end_date=today+7 days.\n"
+    "When asked for 'tomorrow', use date+1.\n"
+    "Do not hallucinate calendar events.\n"
+)
+
+CHAT_CONTEXT = Template(
+    "\n"
+    "Family: $family_name.\n"
+    "The parents are $parents.\n"
+    "Current Date: $today."
+)
+
+# Appended after the cached prompt, so the shared prefix stays intact
+FACTS_BLOCK = Template(
+    "\n\nKnown facts from memory (use them directly; call 'search_memory' only if they don't answer):\n"
+    "$facts"
+)
+
+SPEAKER_LINE = Template("\n\nYou are talking with $speaker.")
+
+# Last render, keyed on (day, config revision)
+_rendered = {}
+
+async def build_system_prompt(facts: list = None, speaker: str = None) -> str:
+    """
+    System prompt for chat. The base is re-rendered only on date rollover or a
+    config write; the speaker and pre-retrieved memory facts are appended per message.
+    """
+    prompt = await _base_prompt()
+    if speaker:
+        prompt += SPEAKER_LINE.substitute(speaker=speaker)
+    if facts:
+        prompt += FACTS_BLOCK.substitute(facts="\n".join(f"- {fact}" for fact in facts))
+    return prompt
+
+async def _base_prompt() -> str:
+    now = datetime.now()
+    key = (now.date(), database.config_revision)
+    if key in _rendered:
+        return _rendered[key]
+
+    fam_name = await database.get_config("family_name") or "Family"
+    parents = await database.get_config("parents") or "Parents"
+    prompt = CHAT_RULES + CHAT_CONTEXT.substitute(
+        family_name=fam_name,
+        parents=parents,
+        today=now.strftime("%Y-%m-%d %A"),
+    )
+
+    _rendered.clear()
+    _rendered[key] = prompt
+    logger.debug(f"System prompt rebuilt ({len(prompt)} chars)")
+    return prompt
@@ -0,0 +1,305 @@
+import aiohttp
+import asyncio
+import os
+import time
+import logging
+from contextvars import ContextVar
+from services.metrics import LLM_SECONDS, LLM_FIRST_TOKEN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+AI_PROVIDER = os.getenv("AI_PROVIDER", "ollama")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://host.docker.internal:11434/api/chat")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Providers that never send data off the box
+LOCAL_PROVIDERS = {"ollama"}
+# Tools whose results (family memory) must not reach a cloud model
+PRIVATE_TOOLS = {t.strip() for t in os.getenv("PRIVATE_TOOLS", "search_memory,remember_fact").split(",") if t.strip()}
+# Keep private requests local. Defaults on when the local model is the primary anyway.
+PIN_PRIVATE_LOCAL = os.getenv("PIN_PRIVATE_LOCAL", "true" if AI_PROVIDER == "ollama" else "false").lower() == "true"
+
+# Tools that act on the world: once one attempt calls them, hedged siblings are cancelled
+SIDE_EFFECT_TOOLS = {"control_device", "remember_fact", "web_search"}
+
+# Start the backup provider too if the first hasn't produced a token by then (0 = never)
+HEDGE_AFTER_MS = float(os.getenv("HEDGE_AFTER_MS", "0"))
+# Put the backup first while the primary's typical first-token time exceeds this (0 = never)
+FAILOVER_LATENCY_MS = float(os.getenv("FAILOVER_LATENCY_MS", "0"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "30"))
+# After a failure, skip the provider for this long unless a health check clears it
+FAILURE_COOLDOWN = 60.0
+EWMA_ALPHA = 0.3
+
+# (race, provider name) of the attempt running in this task
+_attempt = ContextVar("provider_attempt", default=None)
+
+class ProviderState:
+    def __init__(self, name: str, configured: bool):
+        self.name = name
+        self.configured = configured
+        self.healthy = True
+        self.retry_at = 0.0
+        self.ttft_ms = None     # EWMA time to first token
+        self.latency_ms = None  # EWMA time to full answer
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.last_error = None
+
+    def available(self) -> bool:
+        return self.configured and (self.healthy or time.monotonic() >= self.retry_at)
+
+    def observe(self, ttft: float = None, latency: float = None):
+        if ttft is not None:
+            self.ttft_ms = _ewma(self.ttft_ms, ttft * 1000)
+        if latency is not None:
+            self.latency_ms = _ewma(self.latency_ms, latency * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "healthy": self.healthy,
+            "ttft_ms": round(self.ttft_ms) if self.ttft_ms is not None else None,
+            "latency_ms": round(self.latency_ms) if self.latency_ms is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "last_error": self.last_error,
+        }
+
+def _ewma(current, sample):
+    return sample if current is None else EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * current
+
+class _Race:
+    """One request's attempts. The first attempt to produce output owns the user's stream."""
+    def __init__(self, target):
+        self.target = target
+        self.owner = None
+        self.committed = None
+        self.tasks = {}  # task -> name
+        self.started = {}  # task -> monotonic start
+        self.first_token = {}  # name -> seconds since start
+        self.sink_error = None  # the caller's stream failed (e.g. client gone)
+
+    def claim(self, name: str) -> bool:
+        if self.owner is None:
+            self.owner = name
+        return self.owner == name
+
+    def commit(self, name: str):
+        """An attempt is about to cause a side effect: it wins, siblings are cancelled."""
+        if self.committed is not None:
+            return
+        self.committed = name
+        for task, other in self.tasks.items():
+            if other != name:
+                task.cancel()
+
+class _AttemptStream:
+    """Per-attempt stand-in for the TelegramStreamer (or None) the caller passed."""
+    def __init__(self, race: _Race, name: str, started: float):
+        self.race = race
+        self.name = name
+        self.started = started
+
+    def _activity(self) -> bool:
+        self.race.first_token.setdefault(self.name, time.monotonic() - self.started)
+        return self.race.claim(self.name) and self.race.target is not None
+
+    async def _forward(self, method: str, *args):
+        """
+        Call the caller's stream. Its errors are not the provider's fault:
+        they end the whole request (ProviderRouter.ask re-raises them) rather
+        than reaching the attempt's own error handling.
+        """
+        try:
+            await getattr(self.race.target, method)(*args)
+        except Exception as e:
+            self.race.sink_error = e
+            for task in self.race.tasks:
+                task.cancel()
+            raise asyncio.CancelledError() from e
+
+    async def push(self, chunk: str):
+        if self._activity():
+            await self._forward("push", chunk)
+
+    async def reset(self, status: str = None):
+        if self._activity():
+            await self._forward("reset", status)
+
+    async def set_status(self, status: str = None):
+        if self.race.owner in (None, self.name) and self.race.target is not None:
+            await self._forward("set_status", status)
+
+class ProviderRouter:
+    """
+    Picks the LLM provider per request: primary first, automatic failover on
+    errors, optional hedging to the backup when the primary is slow to start,
+    and pinning of privacy-sensitive requests to the local model.
+    Health comes from periodic probes plus every real request's outcome.
+    """
+    def __init__(self, primary: str = AI_PROVIDER):
+        self.primary = primary
+        self.providers = {
+            "ollama": ProviderState("ollama", bool(OLLAMA_URL)),
+            "gemini": ProviderState("gemini", bool(GEMINI_API_KEY) or primary == "gemini"),
+        }
+        self._task = None
+
+    def order(self, private: bool = False) -> list:
+        names = [self.primary] + [n for n in self.providers if n != self.primary]
+        names = [n for n in names if self.providers[n].configured]
+        if private and PIN_PRIVATE_LOCAL:
+            names = [n for n in names if n in LOCAL_PROVIDERS]
+        if FAILOVER_LATENCY_MS and len(names) > 1:
+            ttft = self.providers[names[0]].ttft_ms
+            if ttft is not None and ttft > FAILOVER_LATENCY_MS:
+                names = names[1:] + names[:1]
+        # Providers in cooldown are still tried, but last
+        up = [n for n in names if self.providers[n].available()]
+        return up + [n for n in names if n not in up]
+
+    def guard_tool(self, name: str):
+        """Called before each tool runs. Returns a refusal for the model, or None to proceed."""
+        attempt = _attempt.get()
+        if attempt is None:
+            return None
+        race, provider = attempt
+        if name in PRIVATE_TOOLS and provider not in LOCAL_PROVIDERS and PIN_PRIVATE_LOCAL:
+            return "This information is private to the household and isn't available here."
+        if name in SIDE_EFFECT_TOOLS:
+            race.commit(provider)
+        return None
+
+    async def ask(self, attempt_fn, stream=None, private: bool = False, hedge: bool = True) -> str:
+        """
+        Run attempt_fn(provider_name, stream) on the best provider, failing over
+        (and hedging, if enabled) as needed. attempt_fn returns the reply text;
+        canned error replies and exceptions both count as failures. An error
+        from `stream` itself is re-raised without blaming any provider.
+        """
+        from services.ai import is_error_reply
+        order = self.order(private)
+        if not order:
+            return "Brain Offline."
+        race = _Race(stream)
+        backups = order[1:]
+        hedge_at = time.monotonic() + HEDGE_AFTER_MS / 1000 if hedge and HEDGE_AFTER_MS and backups else None
+        reply = "Brain Offline."
+
+        def start(name: str):
+            started = time.monotonic()
+
+            async def attempt():
+                _attempt.set((race, name))
+                return await attempt_fn(name, _AttemptStream(race, name, started))
+
+            self.providers[name].requests += 1
+            task = asyncio.create_task(attempt())
+            race.tasks[task] = name
+            race.started[task] = started
+
+        start(order[0])
+        try:
+            while race.tasks:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at else None
+                done, _ = await asyncio.wait(race.tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    if not race.first_token and race.committed is None and backups:
+                        name = backups.pop(0)
+                        self.providers[name].hedges += 1
+                        logger.info(f"🐇 No first token after {HEDGE_AFTER_MS:g}ms, hedging to {name}")
+                        start(name)
+                    continue
+
+                for task in done:
+                    name = race.tasks.pop(task)
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    reply = "Brain Error." if error else task.result()
+                    latency = time.monotonic() - race.started[task]
+                    if error is None and not is_error_reply(reply):
+                        self._succeeded(name, race.first_token.get(name), latency)
+                        return reply
+                    self._failed(name, error or reply, latency)
+                    # A failed attempt that already acted must not be repeated elsewhere
+                    if race.committed == name:
+                        return reply
+                    if race.owner == name:
+                        race.owner = None
+                        if stream:
+                            await stream.reset("🔁 Switching to backup brain...")
+                if race.sink_error is not None:
+                    raise race.sink_error
+                if not race.tasks and backups:
+                    start(backups.pop(0))
+            return reply
+        finally:
+            for task in race.tasks:
+                task.cancel()
+
+    def _succeeded(self, name: str, ttft: float, latency: float):
+        state = self.providers[name]
+        state.observe(ttft, latency)
+        LLM_SECONDS.observe(latency, provider=name, outcome="ok")
+        if ttft is not None:
+            LLM_FIRST_TOKEN_SECONDS.observe(ttft, provider=name)
+        if not state.healthy:
+            logger.info(f"🧠 {name} is answering again")
+        state.healthy = True
+
+    def _failed(self, name: str, error, latency: float):
+        state = self.providers[name]
+        LLM_SECONDS.observe(latency, provider=name, outcome="error")
+        state.failures += 1
+        state.last_error = str(error)[:200]
+        state.healthy = False
+        state.retry_at = time.monotonic() + FAILURE_COOLDOWN
+        logger.warning(f"🧠 {name} failed ({state.last_error}); failing over")
+
+    async def check(self):
+        """Probe the local model; cloud health is judged from real requests only."""
+        state = self.providers["ollama"]
+        if not state.configured:
+            return
+        base = OLLAMA_URL.split("/api/")[0]
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{base}/api/version", timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                    ok = resp.status == 200
+        except Exception as e:
+            ok = False
+            state.last_error = str(e)[:200]
+        if ok != state.healthy:
+            logger.info(f"🧠 ollama health: {'up' if ok else 'down'}")
+        state.healthy = ok
+        if not ok:
+            state.retry_at = time.monotonic() + HEALTH_CHECK_INTERVAL
+
+    def start(self):
+        if self._task is None and len([p for p in self.providers.values() if p.configured]) > 1:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _health_loop(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def stats(self) -> dict:
+        return {name: state.stats() for name, state in self.providers.items()}
+
+# Singleton Instance
+providers = ProviderRouter()
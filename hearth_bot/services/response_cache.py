@@ -0,0 +1,111 @@
+import hashlib
+import os
+import re
+import logging
+from contextvars import ContextVar
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+# Side effects (or permission prompts) make an answer unrepeatable
+UNCACHEABLE_TOOLS = {"control_device", "remember_fact", "web_search"}
+# Tools whose results can't be vouched for by a version number; always re-checked
+UNVERSIONED_TOOLS = {"search_memory"}
+
+_PUNCT = re.compile(r"[^\w\s]")
+# Questions that only make sense against the chat history
+_FOLLOW_UP = re.compile(
+    r"^(?:and|but|also|so|then|what about|how about)\b"
+    r"|\b(?:it|that|this|them|those|these|he|she|they|him|her|there)\b"
+)
+
+# Tool calls made while answering the current request: [(tool_call, result digest)]
+tool_log = ContextVar("tool_log", default=None)
+
+def _digest(value) -> str:
+    return hashlib.sha1(str(value).encode("utf-8")).hexdigest()
+
+def record_tool(tool_call, result, failed: bool = False):
+    log = tool_log.get()
+    if log is not None:
+        log.append((tool_call, None if failed else _digest(result)))
+
+def _tool_name(tool_call) -> str:
+    return tool_call.get("function", {}).get("name", "unknown")
+
+def _versions() -> tuple:
+    """Version numbers of the data tools read: state mirror and calendars."""
+    from services import hass
+    from services.state_store import store
+    return (store.revision, hass.calendar_version)
+
+class ResponseCache:
+    """
+    Replies to repeated, self-contained questions.
+    Keyed on normalized text + chat (or user) + system prompt hash, so a reply
+    is only repeated in the chat that got it; follow-ups and private (recalled
+    fact) questions are never cached. Each entry remembers the
+    tool calls it was built from and the data versions at the time: if the
+    versions moved, the (cheap, read-only) tools are re-run and the reply is
+    served only if their results are unchanged.
+    """
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.skipped = 0
+
+    def key(self, user_text: str, system_prompt: str = None, scope: str = None, private: bool = False):
+        """Cache key, or None when the question shouldn't be cached."""
+        if not RESPONSE_CACHE:
+            return None
+        text = " ".join(_PUNCT.sub(" ", (user_text or "").lower()).split())
+        if private or len(text.split()) < 3 or _FOLLOW_UP.search(text):
+            self.skipped += 1
+            return None
+        return (text, str(scope or ""), _digest(system_prompt or ""))
+
+    async def get(self, key, run_tool):
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        reply, calls, versions = entry
+        current = _versions()
+        needs_check = versions != current or any(_tool_name(c) in UNVERSIONED_TOOLS for c, _ in calls)
+        if calls and needs_check:
+            for tool_call, digest in calls:
+                if _digest(await run_tool(tool_call)) != digest:
+                    self._cache.pop(key)
+                    self.stale += 1
+                    self.misses += 1
+                    return None
+            self._cache.set(key, (reply, calls, current))
+        self.hits += 1
+        logger.info(f"⚡ Response cache hit: {key[0]!r}")
+        return reply
+
+    def put(self, key, reply: str, calls: list):
+        # A failed tool means the reply was improvised; don't repeat it
+        if any(_tool_name(c) in UNCACHEABLE_TOOLS or digest is None for c, digest in calls):
+            return
+        self._cache.set(key, (reply, calls, _versions()))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+# Singleton Instance
+responses = ResponseCache()
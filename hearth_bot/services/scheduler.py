@@ -0,0 +1,173 @@
+import asyncio
+import os
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# A Pi-hosted Ollama serves one generation well and several badly; the cloud copes with more
+LLM_CONCURRENCY = int(os.getenv(
+    "LLM_CONCURRENCY", "4" if os.getenv("AI_PROVIDER", "ollama") == "gemini" else "1"
+))
+
+# Lower runs first. Commands (/sleep) jump chat; summaries wait for both.
+PRIORITY_COMMAND = 0
+PRIORITY_CHAT = 1
+PRIORITY_BACKGROUND = 2
+PRIORITIES = (PRIORITY_COMMAND, PRIORITY_CHAT, PRIORITY_BACKGROUND)
+
+class Superseded(Exception):
+    """The user sent a newer message; this request was dropped."""
+
+class Ticket:
+    __slots__ = ("user", "priority", "stream", "granted", "task", "state", "superseded", "position")
+
+    def __init__(self, user, priority: int, stream=None):
+        self.user = user
+        self.priority = priority
+        self.stream = stream
+        self.granted = asyncio.get_running_loop().create_future()
+        self.task = None
+        self.state = "queued"  # -> running -> done
+        self.superseded = False
+        self.position = 0
+
+class LLMScheduler:
+    """
+    Gatekeeper for LLM generations.
+    At most `concurrency` run at once. Waiting requests are served by priority,
+    then round-robin across users, so one chatty user can't starve the rest.
+    A user's new chat message supersedes (cancels) their previous one.
+    """
+    def __init__(self, concurrency: int = LLM_CONCURRENCY):
+        self.concurrency = concurrency
+        self.running = 0
+        self._queues = {p: OrderedDict() for p in PRIORITIES}  # user -> deque of tickets
+        self._latest = {}  # user -> newest chat ticket
+        self.completed = 0
+        self.superseded = 0
+        self.peak_waiting = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for queues in self._queues.values() for q in queues.values())
+
+    async def run(self, fn, user=None, priority: int = PRIORITY_CHAT, stream=None):
+        """
+        Run fn() (a coroutine factory) when a slot frees up. Raises Superseded if
+        the same user sends another chat message first. Queue position is shown
+        on `stream` (a TelegramStreamer or StatusMessage) while waiting.
+        """
+        ticket = Ticket(user, priority, stream)
+        if priority == PRIORITY_CHAT and user is not None:
+            prior = self._latest.get(user)
+            if prior is not None:
+                await self._supersede(prior)
+            self._latest[user] = ticket
+        self._queues[priority].setdefault(user, deque()).append(ticket)
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        self._dispatch()
+        await self._announce()
+
+        try:
+            await ticket.granted
+            if ticket.superseded:
+                raise Superseded()
+            if ticket.position and ticket.stream:
+                await ticket.stream.set_status()
+            ticket.task = asyncio.create_task(fn())
+            try:
+                return await ticket.task
+            except asyncio.CancelledError:
+                if ticket.superseded:
+                    raise Superseded()
+                raise
+        finally:
+            await self._release(ticket)
+
+    async def _supersede(self, ticket: Ticket):
+        ticket.superseded = True
+        self.superseded += 1
+        if ticket.state == "queued":
+            self._remove(ticket)
+            ticket.state = "done"
+            if not ticket.granted.done():
+                ticket.granted.set_exception(Superseded())
+        elif ticket.task is not None:
+            ticket.task.cancel()
+        logger.info(f"⏹️ Superseded stale LLM request for user {ticket.user}")
+
+    def _remove(self, ticket: Ticket):
+        queues = self._queues[ticket.priority]
+        pending = queues.get(ticket.user)
+        if pending and ticket in pending:
+            pending.remove(ticket)
+            if not pending:
+                del queues[ticket.user]
+
+    async def _release(self, ticket: Ticket):
+        if ticket.state == "queued":
+            # Caller gave up (cancelled) while waiting
+            self._remove(ticket)
+        elif ticket.state == "running":
+            self.running -= 1
+            self.completed += 1
+        ticket.state = "done"
+        if self._latest.get(ticket.user) is ticket:
+            del self._latest[ticket.user]
+        self._dispatch()
+        await self._announce()
+
+    def _dispatch(self):
+        while self.running < self.concurrency:
+            ticket = self._next()
+            if ticket is None:
+                return
+            ticket.state = "running"
+            self.running += 1
+            ticket.granted.set_result(True)
+
+    def _next(self):
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            user, pending = next(iter(queues.items()))
+            ticket = pending.popleft()
+            # Served users go to the back of the line
+            if pending:
+                queues.move_to_end(user)
+            else:
+                del queues[user]
+            return ticket
+        return None
+
+    def _order(self) -> list:
+        """Waiting tickets in the order they will be served."""
+        order = []
+        for priority in PRIORITIES:
+            lanes = [list(pending) for pending in self._queues[priority].values()]
+            for i in range(max((len(lane) for lane in lanes), default=0)):
+                order.extend(lane[i] for lane in lanes if i < len(lane))
+        return order
+
+    async def _announce(self):
+        for position, ticket in enumerate(self._order(), 1):
+            if ticket.position == position:
+                continue
+            ticket.position = position
+            if ticket.stream:
+                await ticket.stream.set_status(f"⏳ Busy with other requests. You're #{position} in line...")
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "completed": self.completed,
+            "superseded": self.superseded,
+        }
+
+# Singleton Instance
+scheduler = LLMScheduler()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import re
+import logging
+from services import hass
+from services.state_store import store
+
+logger = logging.getLogger(__name__)
+
+# Per-entity overrides, e.g.
+# {"sensor.mercedes_lock": {"secure_states": ["2"]}, "cover.gate": {"auto_secure": false},
+#  "lock.shed": {"ignore": true}, "switch.garage_relay": {"secure_states": ["off"], "action": "switch.turn_off"}}
+SECURITY_POLICY_PATH = os.getenv(
+    "SECURITY_POLICY_PATH", os.path.join(os.getenv("HEARTH_DATA_DIR", "/app/hearth_data"), "security_policy.json")
+)
+# How long /sleep waits for locks/covers to report the secured state
+SECURE_TIMEOUT = float(os.getenv("SECURE_TIMEOUT", "30"))
+POLL_INTERVAL = 1.0
+
+UNKNOWN_STATES = {"unknown", "unavailable"}
+# Covers that are about light/privacy, not security
+NON_SECURITY_COVERS = {"blind", "curtain", "shade", "shutter", "awning", "damper"}
+OPENING_CLASSES = {"door", "garage_door", "window", "opening", "lock"}
+
+# domain -> (secure states, securing action)
+DOMAIN_RULES = {
+    "lock": ({"locked"}, ("lock", "lock")),
+    "cover": ({"closed"}, ("cover", "close_cover")),
+    "alarm_control_panel": ({"armed_home", "armed_away", "armed_night", "armed_vacation", "armed_custom_bypass"}, None),
+    "binary_sensor": ({"off"}, None),
+}
+
+# Anything else named like a lock/door/garage/gate (e.g. sensor.mercedes_lock) is
+# report-only: listed unless it reads as secure. Use a policy override to teach
+# /sleep its real secure states.
+SECURITY_KEYWORDS = {"lock", "door", "garage", "gate"}
+KEYWORD_DOMAINS = {"sensor", "binary_sensor", "switch"}
+KEYWORD_SECURE_STATES = {"locked", "closed", "off", "secure", "secured"}
+_WORDS = re.compile(r"[a-z]+")
+
+class Finding:
+    __slots__ = ("entity_id", "name", "state", "secure_states", "action")
+
+    def __init__(self, entity_id, name, state, secure_states, action):
+        self.entity_id = entity_id
+        self.name = name
+        self.state = state
+        self.secure_states = secure_states
+        self.action = action  # (domain, service) or None for report-only
+
+def load_policy(path: str = SECURITY_POLICY_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Security policy unreadable ({path}): {e}")
+        return {}
+
+def _rule(state: dict, policy: dict):
+    """(secure_states, action) for an entity, or None if it isn't security-relevant."""
+    eid = state["entity_id"]
+    domain = eid.split(".")[0]
+    attrs = state.get("attributes", {})
+    override = policy.get(eid, {})
+    if override.get("ignore"):
+        return None
+
+    if "secure_states" in override:
+        secure, action = set(override["secure_states"]), None
+    elif domain in DOMAIN_RULES:
+        if domain == "cover" and attrs.get("device_class") in NON_SECURITY_COVERS:
+            return None
+        if domain == "binary_sensor" and attrs.get("device_class") not in OPENING_CLASSES:
+            return _keyword_rule(eid, domain)
+        secure, action = DOMAIN_RULES[domain]
+    else:
+        return _keyword_rule(eid, domain)
+
+    if "action" in override:
+        action = tuple(override["action"].split(".", 1)) if override["action"] else None
+    if override.get("auto_secure") is False:
+        action = None
+    return secure, action
+
+def _keyword_rule(eid: str, domain: str):
+    if domain in KEYWORD_DOMAINS and SECURITY_KEYWORDS & set(_WORDS.findall(eid.split(".", 1)[1])):
+        return KEYWORD_SECURE_STATES, None
+    return None
+
+def evaluate(states: list, policy: dict = None) -> tuple:
+    """
+    Split security-relevant entities into (unsecured, unknown) findings.
+    Pure rules on domain, device_class and state; no LLM involved.
+    """
+    policy = load_policy() if policy is None else policy
+    unsecured, unknown = [], []
+    for s in states:
+        rule = _rule(s, policy)
+        if rule is None:
+            continue
+        secure, action = rule
+        state = s.get("state")
+        if state in secure:
+            continue
+        name = s.get("attributes", {}).get("friendly_name", s["entity_id"])
+        finding = Finding(s["entity_id"], name, state, secure, action)
+        (unknown if state in UNKNOWN_STATES else unsecured).append(finding)
+    return unsecured, unknown
+
+async def _wait_secured(findings: list, timeout: float) -> set:
+    """Entity ids that reached a secure state within the timeout."""
+    pending = {f.entity_id: f.secure_states for f in findings}
+    done = set()
+    changed = asyncio.Event()
+
+    def on_change(entity_id, old_state, new_state):
+        if entity_id in pending and new_state and new_state.get("state") in pending[entity_id]:
+            done.add(entity_id)
+            changed.set()
+
+    store.add_listener(on_change)
+    # Events that landed while the service calls were in flight are already in the mirror
+    if store.ready:
+        for eid, secure_states in pending.items():
+            current = store.get(eid)
+            if current and current.get("state") in secure_states:
+                done.add(eid)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while len(done) < len(pending):
+            if not store.ready:
+                # No live event stream: poll the stragglers instead
+                for eid in pending.keys() - done:
+                    try:
+                        status, data = await hass.client.get_json(f"/api/states/{eid}")
+                    except Exception as e:
+                        logger.warning(f"State poll for {eid} failed: {e}")
+                        continue
+                    if status == 200 and data and data.get("state") in pending[eid]:
+                        done.add(eid)
+            remaining = deadline - loop.time()
+            if remaining <= 0 or len(done) == len(pending):
+                break
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), POLL_INTERVAL if not store.ready else remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        store.remove_listener(on_change)
+    return done
+
+async def secure(findings: list, timeout: float = SECURE_TIMEOUT) -> tuple:
+    """
+    Issue every securing action at once, then wait for the states to confirm.
+    Returns (secured, failed) findings.
+    """
+    findings = [f for f in findings if f.action]
+    if not findings:
+        return [], []
+    results = await asyncio.gather(*[hass.call_action(*f.action, f.entity_id) for f in findings])
+    issued = []
+    failed = []
+    for finding, result in zip(findings, results):
+        if result.startswith("success"):
+            issued.append(finding)
+        else:
+            logger.warning(f"Securing {finding.entity_id} failed: {result}")
+            failed.append(finding)
+    done = await _wait_secured(issued, timeout) if issued else set()
+    secured = [f for f in issued if f.entity_id in done]
+    failed += [f for f in issued if f.entity_id not in done]
+    return secured, failed
+
+def describe(findings: list) -> str:
+    return ", ".join(f"{f.name} ({f.state})" for f in findings)
@@ -0,0 +1,231 @@
+import aiohttp
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional override, otherwise derived from the REST client's base URL
+HASS_WS_URL = os.getenv("HASS_WS_URL")
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 60.0
+# Registries fetched on every connect to map entities to areas
+REGISTRY_COMMANDS = ("config/area_registry/list", "config/device_registry/list", "config/entity_registry/list")
+
+class StateStore:
+    """
+    In-process mirror of Home Assistant's state machine.
+    Subscribes to the WebSocket `state_changed` stream, then takes one
+    /api/states snapshot, and stays current from the events. Reconnects with
+    backoff and resyncs on every connect.
+    """
+    def __init__(self):
+        self.states = {}
+        self.areas = {}  # entity_id -> area name
+        self.revision = 0
+        self.live = False
+        self._client = None
+        self._task = None
+        self._listeners = []
+        self._msg_id = 0
+        self._registry_pending = {}
+        self._registry_data = {}
+
+    @property
+    def ready(self) -> bool:
+        """True while the mirror is connected and synced (safe to serve reads)."""
+        return self.live
+
+    def add_listener(self, callback):
+        """Register callback(entity_id, old_state, new_state). Called on every change and resync."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def get(self, entity_id: str):
+        return self.states.get(entity_id)
+
+    def area(self, entity_id: str):
+        return self.areas.get(entity_id)
+
+    def all(self) -> list:
+        return list(self.states.values())
+
+    def by_domain(self, domain: str) -> list:
+        prefix = f"{domain}."
+        return [s for eid, s in self.states.items() if eid.startswith(prefix)]
+
+    async def start(self, client):
+        """Background WebSocket subscription; the snapshot follows the first connect."""
+        self._client = client
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.live = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def resync(self) -> bool:
+        """Replace the mirror with a fresh /api/states snapshot."""
+        try:
+            status, data = await self._client.get_json("/api/states", timeout=30)
+        except Exception as e:
+            logger.error(f"State snapshot failed: {e}")
+            return False
+        if status != 200 or data is None:
+            logger.error(f"State snapshot failed: HTTP {status}")
+            return False
+
+        old = self.states
+        self.states = {s["entity_id"]: s for s in data}
+        changed = [eid for eid in old.keys() | self.states.keys() if old.get(eid) != self.states.get(eid)]
+        if changed:
+            self.revision += 1
+        for eid in changed:
+            self._notify(eid, old.get(eid), self.states.get(eid))
+        logger.info(f"🏠 State snapshot: {len(self.states)} entities (rev {self.revision})")
+        return True
+
+    def _ws_url(self) -> str:
+        if HASS_WS_URL:
+            return HASS_WS_URL
+        base = self._client.base_url
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        return f"{base}/api/websocket"
+
+    async def _run(self):
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                await self._listen()
+                delay = RECONNECT_MIN
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"HA WebSocket error: {e}")
+                if not self.states:
+                    # Never connected yet: seed the mirror (and its listeners) over REST meanwhile
+                    await self.resync()
+            self.live = False
+            logger.info(f"HA WebSocket reconnecting in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    def _next_id(self) -> int:
+        self._msg_id += 1
+        return self._msg_id
+
+    async def _listen(self):
+        async with await self._client.ws_connect(self._ws_url(), heartbeat=30) as ws:
+            # 1. Auth Handshake
+            msg = await ws.receive_json()
+            if msg.get("type") == "auth_required":
+                token = self._client.headers.get("Authorization", "").replace("Bearer ", "")
+                await ws.send_json({"type": "auth", "access_token": token})
+                msg = await ws.receive_json()
+            if msg.get("type") != "auth_ok":
+                raise ConnectionError(f"HA auth failed: {msg.get('message', msg.get('type'))}")
+
+            # 2. Subscribe first, then snapshot, so nothing falls in the gap
+            self._msg_id = 0
+            sub_id = self._next_id()
+            await ws.send_json({"id": sub_id, "type": "subscribe_events", "event_type": "state_changed"})
+            if not await self.resync():
+                raise ConnectionError("Resync failed")
+            self.live = True
+            logger.info("🏠 HA WebSocket live.")
+
+            # 3. Registries: answers arrive interleaved with events
+            self._registry_pending = {}
+            self._registry_data = {}
+            for command in REGISTRY_COMMANDS:
+                msg_id = self._next_id()
+                self._registry_pending[msg_id] = command
+                await ws.send_json({"id": msg_id, "type": command})
+
+            # 4. Event Stream
+            async for raw in ws:
+                if raw.type == aiohttp.WSMsgType.TEXT:
+                    msg = raw.json()
+                    # HA may coalesce several messages into one JSON array
+                    for item in (msg if isinstance(msg, list) else [msg]):
+                        self._handle(item, sub_id)
+                elif raw.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+        self.live = False
+
+    def _handle(self, msg: dict, sub_id: int):
+        if msg.get("type") == "result" and msg.get("id") == sub_id and not msg.get("success"):
+            raise ConnectionError(f"subscribe_events rejected: {msg.get('error')}")
+        if msg.get("type") == "result" and msg.get("id") in self._registry_pending:
+            self._registry_result(msg)
+            return
+        if msg.get("type") != "event" or msg.get("id") != sub_id:
+            return
+        data = msg.get("event", {}).get("data", {})
+        self._apply(data.get("entity_id"), data.get("new_state"))
+
+    def _registry_result(self, msg: dict):
+        command = self._registry_pending.pop(msg["id"])
+        if not msg.get("success"):
+            # Non-admin tokens can't list registries; areas just stay unknown
+            logger.warning(f"{command} failed: {msg.get('error')}")
+            self._registry_pending.clear()
+            return
+        self._registry_data[command] = msg.get("result") or []
+        if not self._registry_pending:
+            self._apply_registries()
+
+    def _apply_registries(self):
+        area_names = {a["area_id"]: a["name"] for a in self._registry_data.get("config/area_registry/list", [])}
+        device_areas = {d["id"]: d.get("area_id") for d in self._registry_data.get("config/device_registry/list", [])}
+        areas = {}
+        for entry in self._registry_data.get("config/entity_registry/list", []):
+            # Entity-level area overrides the device's
+            area_id = entry.get("area_id") or device_areas.get(entry.get("device_id"))
+            if area_id in area_names:
+                areas[entry["entity_id"]] = area_names[area_id]
+        changed = [eid for eid in areas.keys() | self.areas.keys() if areas.get(eid) != self.areas.get(eid)]
+        self.areas = areas
+        self._registry_data = {}
+        # Listeners re-read the area; the state itself is unchanged
+        for eid in changed:
+            if eid in self.states:
+                self._notify(eid, self.states[eid], self.states[eid])
+        logger.info(f"🏠 Areas: {len(set(areas.values()))} areas over {len(areas)} entities")
+
+    def _apply(self, entity_id: str, new_state: dict):
+        if not entity_id:
+            return
+        old_state = self.states.get(entity_id)
+        if new_state is None:
+            if old_state is None:
+                return
+            del self.states[entity_id]
+        else:
+            # Events queued during the resync may predate the snapshot
+            if old_state and new_state.get("last_updated", "") < old_state.get("last_updated", ""):
+                return
+            self.states[entity_id] = new_state
+        self.revision += 1
+        self._notify(entity_id, old_state, new_state)
+
+    def _notify(self, entity_id, old_state, new_state):
+        for callback in self._listeners:
+            try:
+                callback(entity_id, old_state, new_state)
+            except Exception as e:
+                logger.error(f"State listener error: {e}")
+
+# Singleton Instance
+store = StateStore()
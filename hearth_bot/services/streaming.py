@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+import logging
+from contextlib import suppress
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+# Telegram tolerates roughly one edit per second per chat
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_LIMIT = 4096
+PLACEHOLDER = "💭 ..."
+
+class TelegramStreamer:
+    """
+    Progressive reply for a streaming LLM answer.
+    Posts a placeholder, then edits it as tokens arrive. Edits are coalesced:
+    at most one is in flight, and it always shows the latest text.
+    """
+    def __init__(self, message: types.Message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.reply = None
+        self.text = ""
+        self._shown = ""
+        self._status = PLACEHOLDER
+        self._last_edit = 0.0
+        self._flush_task = None
+
+    async def start(self):
+        self.reply = await self.message.reply(PLACEHOLDER)
+        self._shown = PLACEHOLDER
+        self._last_edit = time.monotonic()
+
+    async def push(self, chunk: str):
+        """Append generated text."""
+        self.text += chunk
+        self._schedule()
+
+    async def set_status(self, status: str = None):
+        """Replace the placeholder text (e.g. queue position) while nothing is generated yet."""
+        self._status = status or PLACEHOLDER
+        if not self.text:
+            self._schedule()
+
+    async def reset(self, status: str = None):
+        """Discard partial text (e.g. the model switched to a tool call)."""
+        self.text = ""
+        self._status = status or "🛠️ Working on it..."
+        self._schedule()
+
+    async def finish(self, final_text: str):
+        """Show the complete answer, splitting it if it exceeds Telegram's limit."""
+        await self._cancel_flush()
+        final_text = final_text or "..."
+        chunks = [final_text[i:i + TELEGRAM_LIMIT] for i in range(0, len(final_text), TELEGRAM_LIMIT)]
+        await self._edit(chunks[0])
+        for extra in chunks[1:]:
+            await self.message.answer(extra)
+
+    async def abort(self):
+        """Remove the placeholder (e.g. the answer is a permission prompt instead)."""
+        await self._cancel_flush()
+        if self.reply:
+            with suppress(TelegramBadRequest):
+                await self.reply.delete()
+
+    def _schedule(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        delay = self._last_edit + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Show a cursor while generation is still running
+        text = f"{self.text} ▌" if self.text else self._status
+        await self._edit(text[-TELEGRAM_LIMIT:] if len(text) > TELEGRAM_LIMIT else text)
+
+    async def _cancel_flush(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+
+    async def _edit(self, text: str):
+        if not self.reply or text == self._shown:
+            return
+        try:
+            await self.reply.edit_text(text)
+            self._shown = text
+        except TelegramRetryAfter as e:
+            logger.warning(f"Stream edit throttled, retry in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+            with suppress(TelegramBadRequest):
+                await self.reply.edit_text(text)
+                self._shown = text
+        except TelegramBadRequest as e:
+            # "message is not modified" and friends are harmless here
+            logger.debug(f"Stream edit skipped: {e}")
+        self._last_edit = time.monotonic()
+
+class StatusMessage:
+    """
+    Stand-in for a TelegramStreamer when replies aren't streamed: shows status
+    updates (e.g. queue position) as a plain reply, edited in place, and
+    removes it once the answer is ready. Updates are sent in the background,
+    latest wins, and never raise into the caller.
+    """
+    def __init__(self, message: types.Message):
+        self.message = message
+        self.reply = None
+        self._status = None
+        self._shown = None
+        self._task = None
+
+    async def set_status(self, status: str = None):
+        self._status = status
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sync())
+
+    async def clear(self):
+        """Delete the status message (call when the answer is sent)."""
+        self._status = None
+        if self._task and not self._task.done():
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        if self.reply:
+            with suppress(TelegramBadRequest):
+                await self.reply.delete()
+            self.reply = None
+
+    async def _sync(self):
+        try:
+            while self._status != self._shown:
+                status = self._status
+                if status is None:
+                    # Slot granted: the reply itself follows shortly
+                    if self.reply:
+                        await self.reply.delete()
+                        self.reply = None
+                elif self.reply is None:
+                    self.reply = await self.message.reply(status)
+                else:
+                    await self.reply.edit_text(status)
+                self._shown = status
+        except Exception as e:
+            logger.debug(f"Status message skipped: {e}")
@@ -1,8 +1,13 @@
 import logging
+from contextvars import ContextVar
 from services import hass
+from services.executor import run_io, run_cpu
 
 logger = logging.getLogger(__name__)
 
+# Who is asking (set by the handler before calling the LLM): {"user": ..., "source": ...}
+request_context = ContextVar("request_context", default={})
+
 # 1. Tool Definitions (Schema)
 TOOLS_SCHEMA = [
     {
@@ -24,10 +29,14 @@ TOOLS_SCHEMA = [
         "type": "function",
         "function": {
             "name": "check_home",
-            "description": "Check the status of devices in the house (lights, sensors, switches, printers, locks, vehicles, etc). Use this before controlling a device to get its entity_id.",
+            "description": "Check the status of devices in the house (lights, sensors, switches, printers, locks, vehicles, etc). Use this before controlling a device to get its entity_id. Without arguments it returns a short overview; pass query/area/domain to look up specific devices.",
             "parameters": {
                 "type": "object",
-                "properties": {}
+                "properties": {
+                    "query": {"type": "string", "description": "Device name or kind, e.g. 'garage door', 'temperature', 'printer ink'."},
+                    "area": {"type": "string", "description": "Room or area, e.g. 'kitchen'."},
+                    "domain": {"type": "string", "description": "e.g. light, switch, sensor, lock, cover"}
+                }
             },
         },
     },
@@ -70,7 +79,8 @@ TOOLS_SCHEMA = [
             "parameters": {
                 "type": "object",
                 "properties": {
-                   "fact": {"type": "string", "description": "The information to remember."}
+                   "fact": {"type": "string", "description": "The information to remember."},
+                   "ttl_days": {"type": "number", "description": "Optional. Forget after this many days (for temporary facts like a guest's wifi code)."}
                 },
                 "required": ["fact"]
             },
@@ -84,7 +94,9 @@ TOOLS_SCHEMA = [
             "parameters": {
                 "type": "object",
                 "properties": {
-                   "query": {"type": "string", "description": "What are you looking for?"}
+                   "query": {"type": "string", "description": "What are you looking for?"},
+                   "mine": {"type": "boolean", "description": "Only facts the current user told you."},
+                   "days": {"type": "number", "description": "Only facts saved in the last N days."}
                 },
                 "required": ["query"]
             },
@@ -92,6 +104,15 @@ TOOLS_SCHEMA = [
     }
 ]
 
+def _ddg_text(query: str, max_results: int = 3):
+    from duckduckgo_search import DDGS
+    return DDGS().text(query, max_results=max_results)
+
+async def search_web(query: str, max_results: int = 3) -> str:
+    """DuckDuckGo search on the IO pool (DDGS is synchronous)."""
+    results = await run_io(_ddg_text, query, max_results)
+    return str(results)
+
 # 2. Execution Logic
 async def execute_tool(tool_call):
     # Support both Ollama (dict) and Gemini (object) formats
@@ -115,7 +136,12 @@ async def execute_tool(tool_call):
         return await hass.get_events_range(args.get("start_date"), args.get("end_date"))
 
     elif name == "check_home":
-        return await hass.get_dashboard_status()
+        import json
+        if isinstance(args, str):
+             try: args = json.loads(args)
+             except: pass
+        args = args or {}
+        return await hass.get_dashboard_status(args.get("query"), args.get("area"), args.get("domain"))
     
     elif name == "control_device":
         import json
@@ -126,12 +152,13 @@ async def execute_tool(tool_call):
 
     elif name == "web_search":
         import os
-        from duckduckgo_search import DDGS
         import json
         if isinstance(args, str):
              try: args = json.loads(args)
              except: pass
         
+        query = args.get("query")
+        
         # Check Authorization
         req_confirm = os.getenv("REQUIRE_SEARCH_CONFIRM", "false").lower() == "true"
         # If we have a 'force' flag (from user approval), skip check.
@@ -142,14 +169,9 @@ async def execute_tool(tool_call):
         if req_confirm and not args.get("approved"):
             # Return special signal to be caught by ai.py/chat.py
             return f"__REQ_PERM__:{query}"
-
-        query = args.get("query")
          
         try:
-            # Use sync DDGS in async context (blocking, but fast enough for minimal use)
-            # or run in executor if needed.
-            results = DDGS().text(query, max_results=3)
-            return str(results)
+            return await search_web(query)
         except Exception as e:
             return f"Search Failed: {e}"
 
@@ -159,7 +181,11 @@ async def execute_tool(tool_call):
         if isinstance(args, str):
              try: args = json.loads(args)
              except: pass
-        success = memory.save_fact(args.get("fact"))
+        if not await memory.wait_ready():
+            return "Memory is still loading. Try again in a moment."
+        ctx = request_context.get()
+        meta = {key: str(ctx[key]) for key in ("user", "source") if ctx.get(key)}
+        success = await run_cpu(memory.save_fact, args.get("fact"), meta, args.get("ttl_days"))
         return "Fact saved to memory." if success else "Failed to save fact."
 
     elif name == "search_memory":
@@ -168,6 +194,14 @@ async def execute_tool(tool_call):
         if isinstance(args, str):
              try: args = json.loads(args)
              except: pass
-        return memory.query_facts(args.get("query"))
+        if not await memory.wait_ready():
+            return "Memory is still loading. Try again in a moment."
+        filters = {}
+        if args.get("mine") and request_context.get().get("user"):
+            filters["user"] = str(request_context.get()["user"])
+        if args.get("days"):
+            import time
+            filters["since"] = time.time() - float(args["days"]) * 86400
+        return await run_cpu(memory.query_facts, args.get("query"), 3, **filters)
 
     return "Error: Tool not found."